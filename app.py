@@ -1,13 +1,33 @@
 
 import os, math, json, time, itertools, re, random
+import click
 from datetime import datetime, timedelta
 from urllib.parse import quote_plus
 
-import requests
-from flask import Flask, request, jsonify, make_response, render_template_string
+from flask import Flask, Response, request, jsonify, make_response, render_template_string, stream_with_context
 from icalendar import Calendar, Event
 from dotenv import load_dotenv
 
+from utils.http import http_get, http_post, http_stats
+from utils.fx import fx_table, usd_to
+from utils.geocode import cached_geocode, normalize_query
+from utils.cache import DiskCache, TTLCache
+from utils.tiles import tile_of, tile_bounds, tiles_rects, tiles_for_ring
+from utils.fanout import fan_out, fan_out_iter
+from utils.weather import cached_forecast, DAILY_VARS, HOURLY_VARS
+from utils.mirrors import race, failover, STATS as MIRROR_STATS
+from utils.travel import optimize_route, cluster_by_area
+from utils.features import feature_bits, score_pois
+from utils.spatial import PoiIndex
+from utils.dedupe import merge_duplicates
+from utils.trips import TripStore
+from utils.singleflight import single_flight, single_flight_stats
+from utils.tokens import TokenManager
+from utils.airports import resolve_iata, airport_coords
+from utils.poistore import PoiStore, import_osm
+from utils.jsonstream import iter_json_array
+from utils.budget import select_under_cap
+
 load_dotenv()
 app = Flask(__name__)
 
@@ -17,8 +37,10 @@ OVERPASS_URLS = [
     "https://overpass-api.de/api/interpreter",
     "https://overpass.kumi.systems/api/interpreter",
 ]
+# Race mirrors (hedge to the next one after OVERPASS_HEDGE_DELAY s) instead of strict failover.
+OVERPASS_HEDGE = os.getenv("OVERPASS_HEDGE", "1") != "0"
+OVERPASS_HEDGE_DELAY = float(os.getenv("OVERPASS_HEDGE_DELAY", 4.0))
 WIKI_GEOSEARCH = "https://en.wikipedia.org/w/api.php"
-EXCHANGERATE_URL = "https://api.exchangerate.host/latest"
 
 AMADEUS_KEY = os.getenv("AMADEUS_API_KEY")
 AMADEUS_SECRET = os.getenv("AMADEUS_API_SECRET")
@@ -26,28 +48,28 @@ GETYOURGUIDE_KEY = os.getenv("GETYOURGUIDE_API_KEY")
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 AMADEUS_HOST = "https://test.api.amadeus.com"
 
-AMADEUS_TOKEN = {"access_token": None, "exp": 0}
 
-def safe_get(url, params=None, timeout=25, headers=None):
-    try:
-        r = requests.get(url, params=params, timeout=timeout, headers=headers)
-        r.raise_for_status()
-        return r
-    except Exception:
-        return None
+TRIPS = TripStore(os.getenv("TRIP_STORE", "memory"))
 
-def safe_post(url, data=None, timeout=30, headers=None, json_body=None):
-    try:
-        if json_body is not None:
-            r = requests.post(url, json=json_body, timeout=timeout, headers=headers)
-        else:
-            r = requests.post(url, data=data, timeout=timeout, headers=headers)
-        r.raise_for_status()
-        return r
-    except Exception:
-        return None
+# Per-source deadlines (seconds from geocode) for the /api/plan fan-out.
+PLAN_DEADLINES = {
+    "weather": float(os.getenv("PLAN_WEATHER_DEADLINE", 20)),
+    "overpass": float(os.getenv("PLAN_OVERPASS_DEADLINE", 45)),
+    "wikipedia": float(os.getenv("PLAN_WIKIPEDIA_DEADLINE", 15)),
+}
+IATA_DEADLINE = float(os.getenv("IATA_DEADLINE", 25))
+
+def safe_get(url, params=None, timeout=25, headers=None, retries=2):
+    return http_get(url, params=params, timeout=timeout, headers=headers, retries=retries)
+
+def safe_post(url, data=None, timeout=30, headers=None, json_body=None, retries=1, stream=False):
+    return http_post(url, data=data, timeout=timeout, headers=headers, json_body=json_body, retries=retries, stream=stream)
 
+@single_flight(key=lambda query: normalize_query(query) or query)
 def geocode_city(query: str):
+    return cached_geocode(query, _geocode_open_meteo)
+
+def _geocode_open_meteo(query: str):
     r = safe_get(OPENMETEO_GEOCODE, {"name": query, "count": 1, "language": "en"}, timeout=20)
     if not r: return None
     data = r.json()
@@ -61,17 +83,24 @@ def geocode_city(query: str):
         "timezone": it.get("timezone") or "UTC",
     }
 
-def get_weather(lat, lon, start_date, end_date, tz):
+def empty_weather():
+    return {"daily": {"time": [], "temperature_2m_max": [], "temperature_2m_min": [], "precipitation_sum": []}}
+
+@single_flight()
+def get_weather(lat, lon, start_date, end_date, tz, hourly=False):
+    return cached_forecast(lat, lon, start_date, end_date, tz, _fetch_forecast, hourly=hourly) or empty_weather()
+
+def _fetch_forecast(lat, lon, start_date, end_date, tz, hourly=False):
     params = {
         "latitude": lat, "longitude": lon,
-        "daily": ["weathercode","temperature_2m_max","temperature_2m_min","precipitation_sum"],
-        "hourly": ["temperature_2m","precipitation","windspeed_10m"],
+        "daily": DAILY_VARS,
         "start_date": start_date, "end_date": end_date, "timezone": tz,
     }
+    if hourly: params["hourly"] = HOURLY_VARS
     r = safe_get(OPENMETEO_FORECAST, params, timeout=30)
-    if not r:
-        return {"daily": {"time": [], "temperature_2m_max": [], "temperature_2m_min": [], "precipitation_sum": []}}
-    return r.json()
+    if not r: return None
+    try: return r.json()
+    except ValueError: return None
 
 # ───────────────── POIs ─────────────────
 INTEREST_TAGS = {
@@ -102,72 +131,186 @@ def classify_osm(tags: dict) -> str:
         pass
     return "general"
 
-def overpass_pois(lat, lon, radius_m, interests, max_items=160):
-    clauses = []
+DEFAULT_OSM_TAGS = [("tourism","attraction"),("amenity","restaurant"),("leisure","park"),("historic",None)]
+# tag keys kept on fetched POIs: interest matching, names, and dedupe's identity tags (wikidata/wikipedia/website)
+POI_TAG_KEYS = ({k for tags in INTEREST_TAGS.values() for t in tags for k in t} | {k for k, _ in DEFAULT_OSM_TAGS}
+                | {"name", "official_name", "wikidata", "wikipedia", "website"})
+OVERPASS_CACHE = "cache"
+OVERPASS_CHUNK = 64 * 1024
+OVERPASS_LOCAL = "local"   # answered from an imported OSM extract (flask import-osm)
+POI_STORE = PoiStore()
+POI_TILE_TTL = int(os.getenv("POI_TILE_TTL_SECONDS", 24*3600))
+POI_TILE_PARTIAL_TTL = 900
+POI_TILE_FETCH_MAX = 2000
+POI_TILE_KEEP = 150
+POI_EXPAND_TARGET = int(os.getenv("POI_EXPAND_TARGET", 8))   # places per interest before we stop widening
+POI_EXPAND_MIN_TOTAL = 20
+POI_EXPAND_FACTOR = 1.5
+POI_EXPAND_MAX_M = 40000
+# no new ring once it would likely end past this (s from the first query; under PLAN_OVERPASS_DEADLINE)
+POI_EXPAND_DEADLINE = float(os.getenv("POI_EXPAND_DEADLINE", 30))
+POI_TILES = TTLCache(maxsize=int(os.getenv("POI_TILE_CACHE_SIZE", 6000)), ttl=POI_TILE_TTL)
+
+def interest_osm_tags(interests):
+    out = []
     for interest in interests or []:
         for tag in INTEREST_TAGS.get(interest, []):
             for k, v in tag.items():
-                clauses += [
-                    f'node["{k}"="{v}"](around:{radius_m},{lat},{lon});',
-                    f'way["{k}"="{v}"](around:{radius_m},{lat},{lon});',
-                    f'relation["{k}"="{v}"](around:{radius_m},{lat},{lon});',
-                ]
-    if not clauses:
-        clauses = [
-            f'node["tourism"="attraction"](around:{radius_m},{lat},{lon});',
-            f'node["amenity"="restaurant"](around:{radius_m},{lat},{lon});',
-            f'node["leisure"="park"](around:{radius_m},{lat},{lon});',
-            f'node["historic"](around:{radius_m},{lat},{lon});',
-        ]
-    query = f"""[out:json][timeout:25];({''.join(clauses)});out center {max_items};"""
-
-    results = []
-    used_url = None
-    for url in OVERPASS_URLS:
-        r = safe_post(url, {"data": query}, timeout=60)
-        if not r: continue
-        data = r.json()
-        for el in data.get("elements", []):
-            tags = el.get("tags", {}) or {}
-            name = tags.get("name") or tags.get("official_name") or "Place"
-            center = el.get("center") or {"lat": el.get("lat"), "lon": el.get("lon")}
-            if center["lat"] is None or center["lon"] is None: continue
-            results.append({
-                "id": f'{el.get("type")}/{el.get("id")}', "name": name,
-                "lat": center["lat"], "lon": center["lon"],
-                "category": classify_osm(tags), "tags": tags,
-                "maps_link": f'https://maps.google.com/?q={center["lat"]},{center["lon"]}',
-            })
-        if results:
-            used_url = url
-            break
-
-    if len(results) < 20:
-        radius2 = min(radius_m*2, 40000)
-        q2 = f"""[out:json][timeout:25];(
-            node["tourism"="attraction"](around:{radius2},{lat},{lon});
-            node["amenity"="restaurant"](around:{radius2},{lat},{lon});
-            node["leisure"="park"](around:{radius2},{lat},{lon});
-            node["historic"](around:{radius2},{lat},{lon});
-        );out center {max_items};"""
-        for url in OVERPASS_URLS:
-            r = safe_post(url, {"data": q2}, timeout=60)
-            if not r: continue
-            data = r.json()
-            for el in data.get("elements", []):
-                tags = el.get("tags", {}) or {}
-                name = tags.get("name") or tags.get("official_name") or "Place"
-                center = el.get("center") or {"lat": el.get("lat"), "lon": el.get("lon")}
-                if center["lat"] is None or center["lon"] is None: continue
-                results.append({
-                    "id": f'{el.get("type")}/{el.get("id")}', "name": name,
-                    "lat": center["lat"], "lon": center["lon"],
-                    "category": classify_osm(tags), "tags": tags,
-                    "maps_link": f'https://maps.google.com/?q={center["lat"]},{center["lon"]}',
-                })
-            if results:
-                used_url = used_url or url
-                break
+                if (k, v) not in out: out.append((k, v))
+    return out
+
+def osm_tag_filter(tag):
+    k, v = tag
+    return f'["{k}"]' if v is None else f'["{k}"="{v}"]'
+
+def osm_key_filter(key, values):
+    """One filter for several values of a key; None among them means any value."""
+    if None in values: return f'["{key}"]'
+    values = sorted(set(values))
+    if len(values) == 1: return osm_tag_filter((key, values[0]))
+    return f'["{key}"~"^({"|".join(re.escape(v) for v in values)})$"]'
+
+def overpass_query(missing):
+    """Compile {(key, value): [tiles]} into one query: tags missing the same tiles are merged into
+    one nwr clause per key (regex union of values) and box covering those tiles, and only tags +
+    positions are returned — nodes carry their own coordinates, ways/relations just a centre."""
+    by_tiles = {}
+    for (k, v), ts in missing.items():
+        by_tiles.setdefault(tuple(tiles_rects(ts)), {}).setdefault(k, set()).add(v)
+    clauses = []
+    for rects, keys in sorted(by_tiles.items()):
+        for k in sorted(keys):
+            clauses += [f"nwr{osm_key_filter(k, keys[k])}({s},{w},{n},{e});" for s, w, n, e in rects]
+    return (f"[out:json][timeout:25];({''.join(clauses)})->.p;"
+            f"node.p;out body {POI_TILE_FETCH_MAX};(way.p;relation.p;);out tags center {POI_TILE_FETCH_MAX};")
+
+def osm_tag_matches(tag, tags):
+    k, v = tag
+    return k in tags if v is None else tags.get(k) == v
+
+def osm_element_poi(el):
+    tags = el.get("tags", {}) or {}
+    center = el.get("center") or {"lat": el.get("lat"), "lon": el.get("lon")}
+    if center.get("lat") is None or center.get("lon") is None: return None
+    cat = el.get("category") or classify_osm(tags)
+    return {
+        "id": f'{el.get("type")}/{el.get("id")}', "name": tags.get("name") or tags.get("official_name") or "Place",
+        "lat": center["lat"], "lon": center["lon"],
+        "category": cat, "tags": tags, "fbits": el["fbits"] if "fbits" in el else feature_bits(cat, tags),
+        "maps_link": f'https://maps.google.com/?q={center["lat"]},{center["lon"]}',
+    }
+
+def slim_element(el):
+    """Classify an Overpass element from its full tags, then keep only the tag keys we read.
+    None if it has no position."""
+    center = el.get("center") or el
+    if center.get("lat") is None or center.get("lon") is None: return None
+    tags = el.get("tags") or {}
+    cat = classify_osm(tags)
+    return {"type": el.get("type"), "id": el.get("id"), "lat": center["lat"], "lon": center["lon"],
+            "category": cat, "fbits": feature_bits(cat, tags),
+            "tags": {k: v for k, v in tags.items() if k in POI_TAG_KEYS}}
+
+def overpass_elements(r):
+    """Slimmed elements of a streamed Overpass response. Overpass reports a timeout or memory
+    overrun as HTTP 200 with the elements it had (often none) and a 'runtime error' remark after
+    them: that raises ValueError once the array has been read, so the answer isn't taken as complete."""
+    tail = {}
+    for el in iter_json_array(r.iter_content(OVERPASS_CHUNK), "elements", tail):
+        el = slim_element(el)
+        if el is not None: yield el
+    if "runtime error" in str(tail.get("remark", "")):
+        raise ValueError(f"overpass: {tail['remark']}")
+
+@single_flight(key=lambda query, collect=list: query)
+def overpass_fetch(query, collect=list):
+    """Run `query` on the mirrors, parsing the body as it streams in. `collect` consumes the
+    slimmed elements (it may stop early; the rest is never downloaded) and its return value is
+    the result. Identical queries share one call, so a query must always get the same `collect`."""
+    def call(url):
+        # no retries here: the race/failover already moves on to another mirror
+        r = safe_post(url, {"data": query}, timeout=60, retries=0, stream=True)
+        if not r: return None
+        try:
+            return collect(overpass_elements(r))
+        except (ValueError, OSError):
+            # malformed or cut-off body (requests' stream errors are OSErrors), or a runtime-error
+            # remark: a failure, so the next mirror is tried and nothing is cached as coverage
+            return None
+        finally:
+            r.close()
+    if OVERPASS_HEDGE:
+        return race(OVERPASS_URLS, call, hedge_delay=OVERPASS_HEDGE_DELAY)
+    return failover(OVERPASS_URLS, call)
+
+def tile_pois(lat, lon, radius_m, tags, inner_m=0):
+    """POIs for `tags` with inner_m < distance <= radius_m: from an imported extract when one covers
+    the area, else assembled from (tile, tag) cache cells where only missing cells hit Overpass."""
+    inner_km = inner_m / 1000.0
+    local = POI_STORE.query(lat, lon, radius_m, tags, keep=POI_TILE_KEEP)
+    if local is not None:
+        pois = [p for p in map(osm_element_poi, local) if p]
+        return [p for p in pois if haversine(lat, lon, p["lat"], p["lon"]) > inner_km] if inner_m else pois, OVERPASS_LOCAL
+    tiles = tiles_for_ring(lat, lon, inner_m, radius_m)
+    missing = {}
+    for tag in tags:
+        ts = [t for t in tiles if (t, tag) not in POI_TILES]
+        if ts: missing[tag] = ts
+    used_url = OVERPASS_CACHE
+    if missing:
+        def fill_cells(elements):
+            cells = {(t, tag): [] for tag, ts in missing.items() for t in ts}
+            open_cells, seen = len(cells), 0
+            for el in elements:
+                seen += 1
+                poi = osm_element_poi(el)
+                t = tile_of(poi["lat"], poi["lon"])
+                for tag in missing:
+                    cell = cells.get((t, tag))
+                    if cell is not None and len(cell) < POI_TILE_KEEP and osm_tag_matches(tag, poi["tags"]):
+                        cell.append(poi)
+                        if len(cell) == POI_TILE_KEEP: open_cells -= 1
+                # every cell is full: anything further would be dropped, so stop reading
+                if not open_cells: break
+            return cells, seen >= POI_TILE_FETCH_MAX or not seen
+        got, used_url = overpass_fetch(overpass_query(missing), fill_cells)
+        if got is not None:
+            cells, partial = got
+            # a truncated response is incomplete coverage, and an empty one may be a mirror having
+            # a bad moment: keep either, but only briefly
+            ttl = POI_TILE_PARTIAL_TTL if partial else None
+            for key, pois in cells.items():
+                POI_TILES.set(key, pois, ttl=ttl)
+    radius_km = radius_m / 1000.0
+    found = {}
+    for t in tiles:
+        for tag in tags:
+            for p in POI_TILES.get((t, tag)) or []:
+                if p["id"] in found: continue
+                d = haversine(lat, lon, p["lat"], p["lon"])
+                if (d > inner_km or not inner_m) and d <= radius_km: found[p["id"]] = (d, p)
+    return [p for _, p in sorted(found.values(), key=lambda x: x[0])], used_url
+
+@single_flight(key=lambda lat, lon, radius_m, interests, max_items=160: (lat, lon, radius_m, tuple(sorted(interests or [])), max_items))
+def overpass_pois(lat, lon, radius_m, interests, max_items=160):
+    started = time.monotonic()
+    results, used_url = tile_pois(lat, lon, radius_m, interest_osm_tags(interests) or DEFAULT_OSM_TAGS)
+    slowest = time.monotonic() - started
+
+    # sparse destination: widen ring by ring, asking only for what is still short
+    inner = radius_m
+    while inner < POI_EXPAND_MAX_M and len(results) < POI_EXPAND_MIN_TOTAL:
+        # another ring would likely finish past the deadline: keep what we have
+        if time.monotonic() - started + slowest > POI_EXPAND_DEADLINE: break
+        tags = expansion_tags(results, interests)
+        if not tags: break
+        outer = min(inner * POI_EXPAND_FACTOR, POI_EXPAND_MAX_M)
+        t0 = time.monotonic()
+        more, url2 = tile_pois(lat, lon, outer, tags, inner_m=inner)
+        slowest = max(slowest, time.monotonic() - t0)
+        results += more
+        used_url = used_url or url2
+        inner = outer
 
     uniq = {}
     for i in results:
@@ -175,6 +318,17 @@ def overpass_pois(lat, lon, radius_m, interests, max_items=160):
         if key not in uniq: uniq[key] = i
     return list(uniq.values())[:max_items], used_url
 
+def expansion_tags(pois, interests):
+    """Tags to look for in the next ring (asked only while the total is under POI_EXPAND_MIN_TOTAL):
+    those of interests with fewer than POI_EXPAND_TARGET places, plus the generic defaults."""
+    tags = []
+    for interest in interests or []:
+        itags = interest_osm_tags([interest])
+        have = sum(1 for p in pois if any(osm_tag_matches(t, p["tags"]) for t in itags))
+        if have < POI_EXPAND_TARGET: tags += [t for t in itags if t not in tags]
+    tags += [t for t in DEFAULT_OSM_TAGS if t not in tags]
+    return tags
+
 def wikipedia_pois(lat, lon, radius_m=15000, limit=60):
     params = {"action":"query","list":"geosearch","gscoord":f"{lat}|{lon}","gsradius":min(radius_m,20000),
               "gslimit":limit,"format":"json"}
@@ -185,7 +339,7 @@ def wikipedia_pois(lat, lon, radius_m=15000, limit=60):
         out.append({
             "id": f"wiki/{g.get('pageid')}", "name": g.get("title") or "Place",
             "lat": g.get("lat"), "lon": g.get("lon"), "category": "culture",
-            "tags": {"source":"wikipedia"},
+            "tags": {"source":"wikipedia"}, "fbits": feature_bits("culture"),
             "maps_link": f"https://maps.google.com/?q={g.get('lat')},{g.get('lon')}"
         })
     return out
@@ -202,21 +356,20 @@ COST_TABLE_USD = {
     "architecture":{"tight":0,"moderate":5,"luxury":10},
     "general":{"tight":0,"moderate":5,"luxury":10},
 }
+CLUSTER_POOL_FACTOR = 3   # candidates per slot considered when grouping days by area
+CAP_POOL_MAX = 300   # best-ranked candidates the budget-capped selection considers
 INDOOR = {"culture","shopping","food","nightlife","architecture"}
 OUTDOOR = {"nature","adventure","photography"}
 
-def fx_rate(to_code: str) -> float:
-    r = safe_get(EXCHANGERATE_URL, {"base":"USD","symbols":to_code}, timeout=20)
-    if not r: return 1.0
-    try: return float(r.json().get("rates", {}).get(to_code, 1.0))
-    except Exception: return 1.0
+def fx_rate(to_code: str, fx=None) -> float:
+    return usd_to(to_code, fx)
 
-def estimate_day(items, budget, currency):
+def estimate_day(items, budget, currency, fx=None):
     usd = 0.0
     for it in items or []:
         cat = it.get("category","general")
         usd += COST_TABLE_USD.get(cat, COST_TABLE_USD["general"])[budget]
-    return round(usd * fx_rate(currency), 2)
+    return round(usd * fx_rate(currency, fx), 2)
 
 def haversine(a_lat, a_lon, b_lat, b_lon):
     R=6371
@@ -224,48 +377,27 @@ def haversine(a_lat, a_lon, b_lat, b_lon):
     h=math.sin(dlat/2)**2+math.cos(math.radians(a_lat))*math.cos(math.radians(b_lat))*math.sin(dlon/2)**2
     return 2*R*math.asin(math.sqrt(h))
 
-def order_nearest_neighbor(items, center_lat, center_lon):
-    if not items: return []
-    def dist_to_center(i):
-        la = items[i].get("lat") or center_lat
-        lo = items[i].get("lon") or center_lon
-        return haversine(center_lat, center_lon, la, lo)
-    start_idx = min(range(len(items)), key=lambda i: dist_to_center(i))
-    unvisited = set(range(len(items)))
-    order = [start_idx]; unvisited.remove(start_idx); cur = start_idx
-    while unvisited:
-        def d(i,j):
-            ai = items[i].get("lat") or center_lat
-            bi = items[i].get("lon") or center_lon
-            aj = items[j].get("lat") or center_lat
-            bj = items[j].get("lon") or center_lon
-            return haversine(ai, bi, aj, bj)
-        nxt = min(unvisited, key=lambda j: d(cur, j))
-        order.append(nxt); unvisited.remove(nxt); cur = nxt
-    return order
-
-def pick_under_cap(candidates, interests, budget, currency, cap):
-    if cap <= 0 or not candidates: return candidates
-    def score(p):
-        s = 1.0
-        if p.get("category") in interests: s += 1.5
-        tags = json.dumps(p.get("tags","")).lower()
-        if "museum" in tags and "culture" in interests: s += .3
-        if "park" in tags and "nature" in interests: s += .3
-        return s
-    priced = []
-    for p in candidates:
-        cat = p.get("category","general")
-        price = COST_TABLE_USD.get(cat, COST_TABLE_USD["general"])[budget] * fx_rate(currency)
-        priced.append((p, score(p), price))
-    priced.sort(key=lambda x: (x[1]/max(x[2],1e-6)), reverse=True)
-    out = []; total=0.0
-    for p, s, price in priced:
-        if total+price <= cap or not out:
-            out.append(p); total += price
-    return out
-
-def plan_itinerary(city, start_date, end_date, companions, budget, interests, pois, per_day_target=3, cap=0, currency="USD"):
+def pick_under_cap(pools, slots, budget, currency, cap, score_of, fx=None):
+    """Best-scoring places per day under a per-day `cap`, chosen for the whole trip at once (see
+    select_under_cap). `pools` holds each day's candidates; pass the same list for every day
+    to let days trade places. Returns each day's POIs in visiting order."""
+    rate = fx_rate(currency, fx)
+    price = {c: v[budget] * rate for c, v in COST_TABLE_USD.items()}
+    place = lambda p: p["name"].strip().lower()   # one visit per place, across days too
+    shared = {}
+    def priced(pool):
+        if id(pool) not in shared:
+            seen = set(); items = []
+            for p in pool:
+                if place(p) in seen: continue
+                seen.add(place(p))
+                cat = p.get("category", "general")
+                items.append((p, cat if cat in price else "general", score_of[id(p)]))
+            shared[id(pool)] = items
+        return shared[id(pool)]
+    return select_under_cap([priced(pool) for pool in pools], slots, cap, price, key=place)
+
+def plan_itinerary(city, start_date, end_date, companions, budget, interests, pois, per_day_target=3, cap=0, currency="USD", fx=None, by_area=False):
     SLOTS = ["Morning","Afternoon","Evening"]
     try:
         start = datetime.fromisoformat(start_date)
@@ -275,38 +407,75 @@ def plan_itinerary(city, start_date, end_date, companions, budget, interests, po
     days = max(1, (end - start).days + 1)
 
     ranked = list(pois or [])
-    def score(p):
-        s = 1.0
-        if p.get("category") in interests: s += 1.5
-        tags = json.dumps(p.get("tags", "")).lower()
-        if "museum" in tags and "culture" in interests: s += .3
-        if "park" in tags and "nature" in interests: s += .3
-        return s
-    ranked.sort(key=score, reverse=True)
+    scores = score_pois(ranked, interests)
+    score_of = {id(p): float(s) for p, s in zip(ranked, scores)}
+    ranked.sort(key=lambda p: score_of[id(p)], reverse=True)
     if not ranked:
         return {"meta": {"city": city, "companions": companions, "budget": budget, "interests": interests}, "days": [
             {"date": (start + timedelta(days=d)).date().isoformat(), "items": []} for d in range(days)
         ]}
 
+    # by_area: one spatial cluster of the best candidates per day, so a day stays in one part of town
+    day_pools = None
+    if by_area and days > 1:
+        pool = ranked[:days * per_day_target * CLUSTER_POOL_FACTOR]
+        day_pools = [[pool[i] for i in g] for g in cluster_by_area(pool, days)]
+        index = PoiIndex(ranked)
+
+    def slot_item(slot, cand):
+        return {"slot":slot,"name":cand["name"],"category":cand.get("category","general"),
+                "lat":cand.get("lat"),"lon":cand.get("lon"),"maps_link":cand.get("maps_link")}
+
+    if cap > 0:
+        # budget-capped: choose every day's places together (areas, if any, limit each day's pool)
+        shared = ranked[:CAP_POOL_MAX]
+        pools = [shared] * days
+        if day_pools:
+            for d in range(days):
+                if not day_pools[d]: continue
+                clat = sum(p["lat"] for p in day_pools[d]) / len(day_pools[d])
+                clon = sum(p["lon"] for p in day_pools[d]) / len(day_pools[d])
+                pools[d] = day_pools[d] + [ranked[i] for i in index.nearest(clat, clon, per_day_target * CLUSTER_POOL_FACTOR)]
+        chosen = pick_under_cap(pools, per_day_target, budget, currency, cap, score_of, fx=fx)
+        plan_days = [{"date": (start + timedelta(days=d)).date().isoformat(),
+                      "items": [slot_item(SLOTS[i], c) for i, c in enumerate(chosen[d])]} for d in range(days)]
+        return {"meta": {"city": city, "companions": companions, "budget": budget, "interests": interests}, "days": plan_days}
+
     cycle = itertools.cycle(ranked)
     plan_days = []
     for d in range(days):
         day_date = (start + timedelta(days=d)).date().isoformat()
+        # a slot the day's own cluster can't fill falls back to places near it, then the global ranking
+        sources = [(cycle, len(ranked))]
+        if day_pools and day_pools[d]:
+            clat = sum(p["lat"] for p in day_pools[d]) / len(day_pools[d])
+            clon = sum(p["lon"] for p in day_pools[d]) / len(day_pools[d])
+            near = [ranked[i] for i in sorted(index.nearest(clat, clon, per_day_target * CLUSTER_POOL_FACTOR))]
+            sources[:0] = [(itertools.cycle(day_pools[d]), len(day_pools[d])), (itertools.cycle(near), len(near))]
         items = []
         last_cat = None
         for slot in SLOTS[:per_day_target]:
-            tries = 0
-            while tries < len(ranked):
-                cand = next(cycle); tries += 1
-                if any(i["name"].lower()==cand["name"].lower() for i in items): continue
-                if last_cat and cand.get("category")==last_cat and len(ranked)>3: continue
-                items.append({"slot":slot,"name":cand["name"],"category":cand.get("category","general"),
-                              "lat":cand.get("lat"),"lon":cand.get("lon"),"maps_link":cand.get("maps_link")})
-                last_cat = cand.get("category"); break
-        items = pick_under_cap(items, interests, budget, currency, cap)
+            for src, n in sources:
+                tries = 0
+                while tries < n:
+                    cand = next(src); tries += 1
+                    if any(i["name"].lower()==cand["name"].lower() for i in items): continue
+                    if last_cat and cand.get("category")==last_cat and n>3: continue
+                    items.append(slot_item(slot, cand))
+                    last_cat = cand.get("category"); break
+                if items and items[-1]["slot"] == slot: break
         plan_days.append({"date": day_date, "items": items})
     return {"meta": {"city": city, "companions": companions, "budget": budget, "interests": interests}, "days": plan_days}
 
+RAIN_MM = 2.0
+
+def is_rainy(precip_mm):
+    return (precip_mm or 0) >= RAIN_MM
+
+def precip_by_date(daily):
+    times = daily.get("time", []); pr = daily.get("precipitation_sum", [])
+    return {times[i]: pr[i] for i in range(min(len(times), len(pr)))}
+
 def rebalance_by_weather(itinerary, daily_precip):
     for day in itinerary["days"]:
         p = daily_precip.get(day["date"], 0)
@@ -316,12 +485,7 @@ def rebalance_by_weather(itinerary, daily_precip):
         else:
             day["items"].sort(key=lambda i: 0 if i.get("category") in OUTDOOR else 1)
 
-def amadeus_token():
-    if not (AMADEUS_KEY and AMADEUS_SECRET):
-        return None
-    now = time.time()
-    if AMADEUS_TOKEN["access_token"] and now < AMADEUS_TOKEN["exp"] - 30:
-        return AMADEUS_TOKEN["access_token"]
+def _amadeus_oauth():
     r = safe_post(
         f"{AMADEUS_HOST}/v1/security/oauth2/token",
         data={"grant_type":"client_credentials","client_id":AMADEUS_KEY,"client_secret":AMADEUS_SECRET},
@@ -329,21 +493,30 @@ def amadeus_token():
         headers={"Content-Type":"application/x-www-form-urlencoded"}
     )
     if not r: return None
-    tok = r.json()
-    AMADEUS_TOKEN["access_token"] = tok.get("access_token")
-    AMADEUS_TOKEN["exp"] = now + int(tok.get("expires_in", 0))
-    return AMADEUS_TOKEN["access_token"]
+    try: return r.json()
+    except ValueError: return None
+
+# refreshed in the background before expiry; request paths only ever read it
+AMADEUS_TOKENS = TokenManager(_amadeus_oauth, name="amadeus")
+if AMADEUS_KEY and AMADEUS_SECRET:
+    AMADEUS_TOKENS.start()
+
+def amadeus_token():
+    if not (AMADEUS_KEY and AMADEUS_SECRET):
+        return None
+    return AMADEUS_TOKENS.get()
 
 def amadeus_city_airports(keyword):
+    """IATA codes for a city, or None if Amadeus couldn't be asked."""
     t = amadeus_token()
-    if not t: return []
+    if not t: return None
     r = safe_get(
         f"{AMADEUS_HOST}/v1/reference-data/locations",
         params={"keyword": keyword, "subType": "AIRPORT,CITY", "page[limit]": 10},
         headers={"Authorization": f"Bearer {t}"},
         timeout=20
     )
-    if not r: return []
+    if not r: return None
     data = r.json().get("data", [])
     codes = []
     for it in data:
@@ -353,10 +526,6 @@ def amadeus_city_airports(keyword):
             codes.append(code)
     return codes[:3]
 
-def parse_iata(text):
-    t = (text or "").strip().upper()
-    return t if len(t)==3 and t.isalpha() else None
-
 def amadeus_flight_offers(origin_code, dest_code, depart, ret=None, adults=1, currency_code="USD"):
     t = amadeus_token()
     if not t: return []
@@ -396,20 +565,52 @@ def amadeus_flight_offers(origin_code, dest_code, depart, ret=None, adults=1, cu
         })
     return out
 
+# hotel ids per (geo tile, radius) barely change; offers are priced live so only briefly reused
+HOTEL_IDS = DiskCache("hotels")
+HOTEL_IDS_TTL = int(os.getenv("HOTEL_IDS_TTL_SECONDS", 7 * 24 * 3600))
+HOTEL_IDS_MISS_TTL = 24 * 3600   # no hotels found (or a bad answer): ask again tomorrow, not next week
+HOTEL_OFFERS = TTLCache(maxsize=2000, ttl=float(os.getenv("HOTEL_OFFERS_TTL_SECONDS", 600)))
+HOTEL_MAX_IDS = int(os.getenv("HOTEL_MAX_IDS", 60))
+HOTEL_CHUNK = 20   # hotelIds per offers request
+HOTEL_OFFERS_DEADLINE = 25
+
+@single_flight(key=lambda lat, lon, radius=10: (tile_of(lat, lon), radius))
 def amadeus_hotels_by_geo(lat, lon, radius=10):
+    tile = tile_of(lat, lon)
+    key = "{}:{}:{}".format(*tile, radius)
+    ids = HOTEL_IDS.get(key)
+    if ids is not None: return ids
     t = amadeus_token()
     if not t: return []
+    # ask from the tile centre so the cached list is the same whichever point in the tile asked first
+    s, w, n, e = tile_bounds(tile)
     r = safe_get(
         f"{AMADEUS_HOST}/v1/reference-data/locations/hotels/by-geocode",
-        params={"latitude": lat, "longitude": lon, "radius": radius, "radiusUnit": "KM"},
+        params={"latitude": round((s + n) / 2, 6), "longitude": round((w + e) / 2, 6), "radius": radius, "radiusUnit": "KM"},
         headers={"Authorization": f"Bearer {t}"},
         timeout=25
     )
     if not r: return []
-    return [h.get("hotelId") for h in r.json().get("data", []) if h.get("hotelId")][:20]
+    ids = [h.get("hotelId") for h in r.json().get("data", []) if h.get("hotelId")][:HOTEL_MAX_IDS]
+    HOTEL_IDS.set(key, ids, ttl=HOTEL_IDS_TTL if ids else HOTEL_IDS_MISS_TTL)
+    return ids
 
 def amadeus_hotel_offers(hotel_ids, checkin, checkout, currency_code="USD"):
+    """Offers for any number of hotels: HOTEL_CHUNK-sized requests run in parallel, each cached briefly."""
     if not hotel_ids: return []
+    chunks = [tuple(hotel_ids[i:i+HOTEL_CHUNK]) for i in range(0, len(hotel_ids), HOTEL_CHUNK)]
+    got = fan_out({str(i): (lambda c=c: _hotel_offers_chunk(c, checkin, checkout, currency_code), HOTEL_OFFERS_DEADLINE)
+                   for i, c in enumerate(chunks)})
+    out = [o for i in range(len(chunks)) for o in got.get(str(i)) or []]
+    def p(x):
+        try: return float(x.get("price", "1e9"))
+        except: return 1e9
+    return sorted(out, key=p)[:12]
+
+def _hotel_offers_chunk(hotel_ids, checkin, checkout, currency_code):
+    key = (hotel_ids, checkin, checkout, currency_code)
+    hit = HOTEL_OFFERS.get(key)
+    if hit is not None: return hit
     t = amadeus_token()
     if not t: return []
     r = safe_get(
@@ -431,10 +632,8 @@ def amadeus_hotel_offers(hotel_ids, checkin, checkout, currency_code="USD"):
                 "checkin": off.get("checkInDate"), "checkout": off.get("checkOutDate"),
                 "deeplink": f"https://www.booking.com/searchresults.html?ss={quote_plus(hname)}",
             })
-    def p(x):
-        try: return float(x.get("price", "1e9"))
-        except: return 1e9
-    return sorted(out, key=p)[:12]
+    HOTEL_OFFERS.set(key, out)
+    return out
 
 def getyourguide_activities(lat, lon, currency="USD", limit=12):
     if not GETYOURGUIDE_KEY:
@@ -454,11 +653,15 @@ def getyourguide_activities(lat, lon, currency="USD", limit=12):
     return out[:limit]
 
 # ───────────────── Demo price engines ─────────────────
+def city_coords(text):
+    geo = geocode_city(text)
+    return (geo["lat"], geo["lon"]) if geo else None
+
 def demo_flight_offers(origin_text, dest_text, depart, ret, currency="USD"):
     # distance-based price estimate
-    o = geocode_city(origin_text) or {"lat":0,"lon":0}
-    d = geocode_city(dest_text) or {"lat":0,"lon":0}
-    dist = haversine(o["lat"], o["lon"], d["lat"], d["lon"]) if o["lat"] and d["lat"] else 3500
+    o = airport_coords(origin_text) or city_coords(origin_text)
+    d = airport_coords(dest_text) or city_coords(dest_text)
+    dist = haversine(o[0], o[1], d[0], d[1]) if o and d else 3500
     base = 60.0 + 0.08*dist  # rough USD
     variants = [("DemoAir", 1.00), ("SampleJet", 0.9), ("BudgetFly", 0.75)]
     offers=[]
@@ -543,35 +746,51 @@ def ai_edit(message, state):
     return state, "Updated."
 
 # ───────────────── API: planning ─────────────────
-@app.post("/api/plan")
-def api_plan():
-    data = request.get_json(force=True)
-    dest = (data.get("destination") or "").strip()
-    origin = (data.get("origin") or "").strip()
-    start = data.get("start_date")
-    end = data.get("end_date")
-    interests = data.get("interests") or ["culture","food"]
-    budget = data.get("budget") or "moderate"
-    companions = data.get("companions") or "solo"
-    radius_km = int(data.get("radius_km") or 12)
-    currency = data.get("currency") or "USD"
-    optimize = bool(data.get("optimize", True))
-    cap_enabled = bool(data.get("cap_enabled", False))
-    cap_value = float(data.get("cap_value") or 0.0)
-
-    if not dest or not start or not end:
-        return jsonify({"error":"destination, start_date, end_date are required"}), 400
-
-    geo = geocode_city(dest)
-    if not geo: return jsonify({"error":"Could not geocode that city"}), 400
+def plan_params(data):
+    """Normalise a /api/plan body. Returns (params, error message)."""
+    p = {
+        "dest": (data.get("destination") or "").strip(),
+        "origin": (data.get("origin") or "").strip(),
+        "start": data.get("start_date"),
+        "end": data.get("end_date"),
+        "interests": data.get("interests") or ["culture","food"],
+        "budget": data.get("budget") or "moderate",
+        "companions": data.get("companions") or "solo",
+        "radius_km": int(data.get("radius_km") or 12),
+        "currency": data.get("currency") or "USD",
+        "cap_enabled": bool(data.get("cap_enabled", False)),
+        "cap_value": float(data.get("cap_value") or 0.0),
+    }
+    # optimize: true/false for per-day route order, or "trip" to also group each day by area
+    optimize = data.get("optimize", True)
+    p["by_area"] = optimize in ("trip", "cluster")
+    p["optimize"] = bool(optimize)
+    if not p["dest"] or not p["start"] or not p["end"]:
+        return p, "destination, start_date, end_date are required"
+    return p, None
+
+def plan_sources(p, geo):
+    # weather, Overpass and Wikipedia only depend on the geocode: run them side by side
+    lat, lon, radius_km = geo["lat"], geo["lon"], p["radius_km"]
+    return {
+        "weather": (lambda: get_weather(lat, lon, p["start"], p["end"], geo["timezone"]), PLAN_DEADLINES["weather"]),
+        "overpass": (lambda: overpass_pois(lat, lon, int(radius_km*1000), p["interests"], max_items=200), PLAN_DEADLINES["overpass"]),
+        "wikipedia": (lambda: wikipedia_pois(lat, lon, radius_m=int(radius_km*1200), limit=80), PLAN_DEADLINES["wikipedia"]),
+    }
 
-    weather = get_weather(geo["lat"], geo["lon"], start, end, geo["timezone"])
-    pois, overpass_used = overpass_pois(geo["lat"], geo["lon"], int(radius_km*1000), interests, max_items=200)
+def merge_sources(got):
+    pois, overpass_used = got.get("overpass") or ([], None)
+    pois = list(pois)
 
     sources = []
-    if pois: sources.append(f"Overpass ({'main' if overpass_used==OVERPASS_URLS[0] else 'mirror'})")
+    if pois:
+        if overpass_used == OVERPASS_LOCAL:
+            sources.append("OpenStreetMap (local extract)")
+        else:
+            via = "cache" if overpass_used == OVERPASS_CACHE else ("main" if overpass_used == OVERPASS_URLS[0] else "mirror")
+            sources.append(f"Overpass ({via})")
     if len(pois) < 20:
-        wiki = wikipedia_pois(geo["lat"], geo["lon"], radius_m=int(radius_km*1200), limit=80)
+        wiki = got.get("wikipedia") or []
         seen = set((p["name"].strip().lower() for p in pois))
         added=0
         for w in wiki:
@@ -579,25 +798,30 @@ def api_plan():
             if k not in seen:
                 pois.append(w); seen.add(k); added+=1
         if added: sources.append("Wikipedia Nearby")
+    # same landmark as node/way/relation/wiki page: keep one, the richest
+    return merge_duplicates(pois), sources
 
-    itinerary = plan_itinerary(geo["name"], start, end, companions, budget, interests, pois,
-                               per_day_target=3, cap=cap_value if cap_enabled else 0, currency=currency)
+def build_plan(p, geo, weather, pois, sources, fx, store=True):
+    budget, currency = p["budget"], p["currency"]
+    itinerary = plan_itinerary(geo["name"], p["start"], p["end"], p["companions"], budget, p["interests"], pois,
+                               per_day_target=3, cap=p["cap_value"] if p["cap_enabled"] else 0, currency=currency,
+                               fx=fx, by_area=p["by_area"])
 
-    daily = weather.get("daily", {})
-    times = daily.get("time", []); pr = daily.get("precipitation_sum", [])
-    precip = {times[i]: pr[i] for i in range(min(len(times), len(pr)))}
+    precip = precip_by_date(weather.get("daily", {}))
     itinerary["days"].sort(key=lambda d: precip.get(d["date"], 0))
     # indoor/outdoor balance on rain
     for d in itinerary["days"]:
-        p = precip.get(d["date"], 0) or 0
-        if p >= 2.0:
+        if is_rainy(precip.get(d["date"])):
             d["items"].sort(key=lambda i: 0 if i.get("category") in INDOOR else 1)
+    # what the plan was built against, so /api/replan can tell which days actually changed
+    itinerary["meta"]["currency"] = currency
+    itinerary["meta"]["forecast"] = {d["date"]: precip.get(d["date"]) for d in itinerary["days"]}
 
-    if optimize:
+    if p["optimize"]:
         for day in itinerary["days"]:
             items = list(day.get("items", []))
             if len(items) > 2:
-                order = order_nearest_neighbor(items, geo["lat"], geo["lon"])
+                order = optimize_route(items, (geo["lat"], geo["lon"]))
                 day["items"] = [items[i] for i in order]
 
     for day in itinerary["days"]:
@@ -605,14 +829,13 @@ def api_plan():
             lat, lon = item.get("lat"), item.get("lon")
             item["maps_link"] = item.get("maps_link") or (f"https://maps.google.com/?q={lat},{lon}" if lat and lon
                                                           else f"https://www.google.com/maps/search/?api=1&query={quote_plus(item.get('name','')+' '+geo['name'])}")
-        day["estimated_cost"] = estimate_day(day.get("items", []), budget, currency)
+        day["estimated_cost"] = estimate_day(day.get("items", []), budget, currency, fx=fx)
 
     provider_status = {
         "amadeus": bool(AMADEUS_KEY and AMADEUS_SECRET),
         "getyourguide": bool(GETYOURGUIDE_KEY)
     }
-
-    return jsonify({
+    out = {
         "geo": geo,
         "weather": weather.get("daily", {}),
         "itinerary": itinerary,
@@ -620,34 +843,112 @@ def api_plan():
         "poi_count": len(pois),
         "sources_used": sources or ["(no POIs — try a bigger radius)"],
         "provider_status": provider_status
-    })
+    }
+    if store:
+        out["trip_id"] = TRIPS.create({"geo": geo, "itinerary": itinerary, "weather": out["weather"],
+                                       "currency": currency, "budget": budget, "optimize": p["optimize"]})
+    return out
+
+@app.post("/api/plan")
+def api_plan():
+    p, err = plan_params(request.get_json(force=True))
+    if err: return jsonify({"error": err}), 400
+
+    geo = geocode_city(p["dest"])
+    if not geo: return jsonify({"error":"Could not geocode that city"}), 400
+
+    got = fan_out(plan_sources(p, geo))
+    pois, sources = merge_sources(got)
+    return jsonify(build_plan(p, geo, got.get("weather") or empty_weather(), pois, sources, fx_table()))
+
+@app.post("/api/plan/stream")
+def api_plan_stream():
+    """NDJSON variant of /api/plan: one line per stage — geo, weather, a draft itinerary each
+    time another POI source lands, then the final plan (with trip_id) as stage "done"."""
+    p, err = plan_params(request.get_json(force=True))
+    if err: return jsonify({"error": err}), 400
+
+    geo = geocode_city(p["dest"])
+    if not geo: return jsonify({"error":"Could not geocode that city"}), 400
+
+    def line(obj):
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
+    def events():
+        yield line({"stage": "geo", "geo": geo})
+        try:
+            tasks = plan_sources(p, geo)
+            got = {}; fx = fx_table()
+            for name, result in fan_out_iter(tasks):
+                got[name] = result
+                weather = got.get("weather") or empty_weather()
+                if name == "weather":
+                    yield line({"stage": "weather", "weather": weather.get("daily", {})})
+                pois, sources = merge_sources(got)
+                if pois and len(got) < len(tasks):
+                    yield line({"stage": "itinerary", **build_plan(p, geo, weather, pois, sources, fx, store=False)})
+            pois, sources = merge_sources(got)
+            yield line({"stage": "done", **build_plan(p, geo, got.get("weather") or empty_weather(), pois, sources, fx)})
+        except Exception:
+            app.logger.exception("streamed plan failed")
+            yield line({"stage": "error", "error": "Planning failed — please try again"})
+
+    return Response(stream_with_context(events()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def with_trip(payload):
+    """Fill `itinerary`/`geo` (and plan defaults) from the trip store when the client sent a
+    trip_id instead of the blobs. Returns None for an unknown or expired id."""
+    trip_id = payload.get("trip_id")
+    if not trip_id: return payload
+    trip = TRIPS.get(trip_id)
+    if trip is None: return None
+    return {**trip, **{k: v for k, v in payload.items() if k not in ("itinerary", "geo")}}
+
+def unknown_trip():
+    return jsonify({"error": "Unknown or expired trip_id — generate the itinerary again"}), 404
 
 # Live replan
 @app.post("/api/replan")
 def api_replan():
-    payload = request.get_json(force=True)
+    """Incremental: only days whose rain outlook flipped (or whose pricing inputs changed) are
+    re-sorted, re-routed and re-priced; the response carries just those days."""
+    payload = with_trip(request.get_json(force=True))
+    if payload is None: return unknown_trip()
     itin = payload.get("itinerary")
     geo = payload.get("geo")
     currency = payload.get("currency","USD")
     budget = payload.get("budget","moderate")
     optimize = bool(payload.get("optimize", True))
-    w = get_weather(geo["lat"], geo["lon"], itin["days"][0]["date"], itin["days"][-1]["date"], geo.get("timezone","UTC"))
+    dates = sorted(d["date"] for d in itin["days"])
+    w = get_weather(geo["lat"], geo["lon"], dates[0], dates[-1], geo.get("timezone","UTC"))
     daily = w.get("daily",{})
-    times = daily.get("time", []); pr = daily.get("precipitation_sum", [])
-    precip = {times[i]: pr[i] for i in range(min(len(times), len(pr)))}
-    for d in itin["days"]:
-        p = precip.get(d["date"], 0) or 0
-        if p >= 2.0:
+    precip = precip_by_date(daily)
+    meta = itin.setdefault("meta", {})
+    old = meta.get("forecast")
+    repriced = meta.get("budget") != budget or meta.get("currency") != currency
+    changed = []
+    for idx, d in enumerate(itin["days"]):
+        rain_changed = old is None or d["date"] not in old or is_rainy(old[d["date"]]) != is_rainy(precip.get(d["date"]))
+        if rain_changed or repriced or "estimated_cost" not in d:
+            changed.append(idx)
+    fx = fx_table() if changed else None
+    for idx in changed:
+        d = itin["days"][idx]
+        if is_rainy(precip.get(d["date"])):
             d["items"].sort(key=lambda i: 0 if i.get("category") in INDOOR else 1)
-    if optimize:
-        for day in itin["days"]:
-            items = list(day.get("items", []))
-            if len(items) > 2:
-                order = order_nearest_neighbor(items, geo["lat"], geo["lon"])
-                day["items"] = [items[i] for i in order]
-    for day in itin["days"]:
-        day["estimated_cost"] = estimate_day(day.get("items", []), budget, currency)
-    return jsonify({"itinerary": itin, "weather": daily})
+        items = list(d.get("items", []))
+        if optimize and len(items) > 2:
+            d["items"] = [items[i] for i in optimize_route(items, (geo["lat"], geo["lon"]))]
+        d["estimated_cost"] = estimate_day(d.get("items", []), budget, currency, fx=fx)
+    forecast = {d["date"]: precip.get(d["date"]) for d in itin["days"]}
+    if payload.get("trip_id"):
+        meta.update({"forecast": forecast, "budget": budget, "currency": currency})
+        trip = {k: v for k, v in payload.items() if k != "trip_id"}
+        TRIPS.put(payload["trip_id"], {**trip, "itinerary": itin, "weather": daily})
+    return jsonify({"changed_days": [{"index": i, "day": itin["days"][i]} for i in changed],
+                    "meta": {"forecast": forecast, "budget": budget, "currency": currency},
+                    "weather": daily})
 
 # ───────────────── API: Search & Book ─────────────────
 @app.post("/api/search/flights")
@@ -663,9 +964,11 @@ def api_flights():
     offers=[]
 
     if AMADEUS_KEY and AMADEUS_SECRET:
-        # robust IATA inference
-        o_iata = parse_iata(origin_text) or (amadeus_city_airports(origin_text)[:1] or [None])[0]
-        d_iata = parse_iata(dest_text)   or (amadeus_city_airports(dest_text)[:1] or [None])[0]
+        # both ends at once; bundled table and cache first, Amadeus only on a miss
+        got = fan_out({end: (lambda text=text: resolve_iata(text, amadeus_city_airports), IATA_DEADLINE)
+                       for end, text in (("origin", origin_text), ("destination", dest_text))})
+        o_iata = (got.get("origin") or [None])[0]
+        d_iata = (got.get("destination") or [None])[0]
         if o_iata and d_iata:
             try:
                 offers = amadeus_flight_offers(o_iata, d_iata, start, end, adults=1, currency_code=currency)
@@ -681,7 +984,8 @@ def api_flights():
 
 @app.post("/api/search/hotels")
 def api_hotels():
-    data = request.get_json(force=True)
+    data = with_trip(request.get_json(force=True))
+    if data is None: return unknown_trip()
     geo = data.get("geo")
     start = data.get("start_date")
     end = data.get("end_date")
@@ -706,7 +1010,8 @@ def api_hotels():
 
 @app.post("/api/search/activities")
 def api_activities():
-    data = request.get_json(force=True)
+    data = with_trip(request.get_json(force=True))
+    if data is None: return unknown_trip()
     geo = data.get("geo")
     itinerary = data.get("itinerary", {})
     currency = data.get("currency","USD")
@@ -720,6 +1025,10 @@ def api_activities():
         provider = "demo-prices"
     return jsonify({"provider": provider, "activities": acts})
 
+@app.get("/api/upstreams")
+def api_upstreams():
+    return jsonify({"hosts": http_stats(), "overpass_mirrors": MIRROR_STATS.snapshot(), "single_flight": single_flight_stats()})
+
 # ───────────────── AI edit ─────────────────
 @app.post("/api/ai-edit")
 def api_ai_edit():
@@ -755,8 +1064,10 @@ def itinerary_to_csv_text(itinerary):
 
 @app.post("/api/export/ics")
 def api_export_ics():
-    payload = request.get_json(force=True)
-    ics = itinerary_to_ics_bytes(payload.get("itinerary", {}), tz=payload.get("tz","UTC"))
+    payload = with_trip(request.get_json(force=True))
+    if payload is None: return unknown_trip()
+    tz = payload.get("tz") or (payload.get("geo") or {}).get("timezone") or "UTC"
+    ics = itinerary_to_ics_bytes(payload.get("itinerary", {}), tz=tz)
     resp = make_response(ics)
     resp.headers["Content-Type"] = "text/calendar"
     resp.headers["Content-Disposition"] = "attachment; filename=itinerary.ics"
@@ -764,7 +1075,8 @@ def api_export_ics():
 
 @app.post("/api/export/csv")
 def api_export_csv():
-    payload = request.get_json(force=True)
+    payload = with_trip(request.get_json(force=True))
+    if payload is None: return unknown_trip()
     csv_text = itinerary_to_csv_text(payload.get("itinerary", {}))
     resp = make_response(csv_text)
     resp.headers["Content-Type"] = "text/csv"
@@ -773,7 +1085,8 @@ def api_export_csv():
 
 @app.post("/api/export/json")
 def api_export_json():
-    payload = request.get_json(force=True)
+    payload = with_trip(request.get_json(force=True))
+    if payload is None: return unknown_trip()
     resp = make_response(json.dumps(payload.get("itinerary", {}), ensure_ascii=False, indent=2))
     resp.headers["Content-Type"] = "application/json"
     resp.headers["Content-Disposition"] = "attachment; filename=itinerary.json"
@@ -860,6 +1173,7 @@ hr{ border:none; border-top:1px solid var(--border); margin:10px 0;}
       <hr/>
       <div class="flex">
         <label><input id="optimize" type="checkbox" checked> Optimize per-day route</label>
+        <label><input id="by_area" type="checkbox"> Group each day by area</label>
         <label><input id="cap_enabled" type="checkbox"> Budget cap per day</label>
         <input id="cap_value" type="text" placeholder="e.g., 100 (USD)">
       </div>
@@ -949,7 +1263,7 @@ function getVals(){
     currency: document.getElementById('currency').value,
     radius_km: parseInt(document.getElementById('radius').value || '12'),
     interests: ints.length?ints:["culture","food"],
-    optimize: document.getElementById('optimize')?document.getElementById('optimize').checked:true,
+    optimize: (document.getElementById('by_area')&&document.getElementById('by_area').checked)?"trip":(document.getElementById('optimize')?document.getElementById('optimize').checked:true),
     cap_enabled: document.getElementById('cap_enabled')?document.getElementById('cap_enabled').checked:false,
     cap_value: parseFloat(document.getElementById('cap_value')?document.getElementById('cap_value').value:'0')
   };
@@ -969,16 +1283,32 @@ function demo(){
 }
 
 async function generate(){
-  const vals=getVals(); STATE=JSON.parse(JSON.stringify(vals));
+  const vals=getVals(); STATE=JSON.parse(JSON.stringify(vals)); RESP=null;
   const s=document.getElementById('status'); s.textContent="Planning your trip...";
   try{
-    const res=await fetch('/api/plan',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(vals)});
-    const data=await res.json(); if(!res.ok){ s.textContent=data.error||"Error"; return; }
-    RESP=data; s.textContent="Done."; renderPlan(vals); document.getElementById('commerce').style.display='block';
+    const res=await fetch('/api/plan/stream',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(vals)});
+    if(!res.ok){ const data=await res.json(); s.textContent=data.error||"Error"; return; }
+    const reader=res.body.getReader(); const dec=new TextDecoder(); let buf='';
+    for(;;){
+      const {value, done}=await reader.read(); if(done) break;
+      buf+=dec.decode(value,{stream:true}); let nl;
+      while((nl=buf.indexOf('\\n'))>=0){ const line=buf.slice(0,nl).trim(); buf=buf.slice(nl+1); if(line) onPlanEvent(JSON.parse(line), vals); }
+    }
+    if(!RESP || !RESP.trip_id){ if(!s.textContent.startsWith('Planning failed')) s.textContent="Planning did not finish."; return; }
+    s.textContent="Done."; document.getElementById('commerce').style.display='block';
     await searchCommerce(vals);
   }catch(e){ s.textContent="Network error."; }
 }
 
+function onPlanEvent(ev, vals){
+  const s=document.getElementById('status');
+  if(ev.stage==='geo'){ setMarkers([], [ev.geo.lat, ev.geo.lon]); s.textContent=`Found ${ev.geo.name} — fetching weather and places...`; }
+  else if(ev.stage==='weather'){ s.textContent=`Weather for ${(ev.weather.time||[]).length} day(s) in — gathering places...`; }
+  else if(ev.stage==='itinerary'){ RESP=ev; renderPlan(vals); s.textContent=`Draft from ${ev.sources_used.join(' + ')} — refining...`; }
+  else if(ev.stage==='done'){ RESP=ev; renderPlan(vals); }
+  else if(ev.stage==='error'){ s.textContent=ev.error||"Error"; }
+}
+
 function renderPlan(vals){
   const out=document.getElementById('output'); const g=RESP.geo; const w=RESP.weather; const itin=RESP.itinerary;
   document.getElementById('sticky').style.display='block';
@@ -1010,13 +1340,17 @@ function renderPlan(vals){
 function showDay(idx){ const day=(RESP?.itinerary?.days||[])[idx]; if(!day) return; const g=RESP.geo; setMarkers(day.items,[g.lat,g.lon]); }
 
 async function replan(){
-  const payload={itinerary:RESP.itinerary, geo:RESP.geo, currency:RESP.currency, budget:STATE.budget, optimize:STATE.optimize};
+  const payload={trip_id:RESP.trip_id, currency:RESP.currency, budget:STATE.budget, optimize:STATE.optimize};
   const res=await fetch('/api/replan',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(payload)});
-  const data=await res.json(); RESP.itinerary=data.itinerary; RESP.weather=data.weather; renderPlan(getVals());
+  const data=await res.json(); if(!res.ok){ document.getElementById('status').textContent=data.error||"Error"; return; }
+  (data.changed_days||[]).forEach(c=>{ RESP.itinerary.days[c.index]=c.day; });
+  Object.assign(RESP.itinerary.meta, data.meta||{}); RESP.weather=data.weather;
+  document.getElementById('status').textContent=`Re-planned: ${(data.changed_days||[]).length} day(s) changed.`;
+  renderPlan(getVals());
 }
 
 async function exportFile(kind){
-  if(!RESP) return; const payload={itinerary:RESP.itinerary, tz:RESP.geo?.timezone||"UTC"};
+  if(!RESP) return; const payload={trip_id:RESP.trip_id};
   const url = kind==="ics"?"/api/export/ics":(kind==="csv"?"/api/export/csv":"/api/export/json");
   const res=await fetch(url,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(payload)});
   const blob=await res.blob(); const a=document.createElement('a');
@@ -1052,7 +1386,7 @@ async function searchCommerce(vals){
 
   // Hotels
   const hr=await fetch('/api/search/hotels',{method:'POST',headers:{'Content-Type':'application/json'},
-    body:JSON.stringify({geo:RESP.geo,start_date:vals.start_date,end_date:vals.end_date,currency:vals.currency,budget:vals.budget})});
+    body:JSON.stringify({trip_id:RESP.trip_id,start_date:vals.start_date,end_date:vals.end_date,currency:vals.currency,budget:vals.budget})});
   const hdata=await hr.json(); document.getElementById('hoProv').textContent = `(${hdata.provider})`;
   const ho=document.getElementById('hotels'); ho.innerHTML='';
   hdata.offers.forEach(o=>{
@@ -1066,7 +1400,7 @@ async function searchCommerce(vals){
 
   // Activities
   const ar=await fetch('/api/search/activities',{method:'POST',headers:{'Content-Type':'application/json'},
-    body:JSON.stringify({geo:RESP.geo,itinerary:RESP.itinerary,currency:vals.currency})});
+    body:JSON.stringify({trip_id:RESP.trip_id,currency:vals.currency})});
   const adata=await ar.json(); document.getElementById('acProv').textContent = `(${adata.provider})`;
   const ac=document.getElementById('acts'); ac.innerHTML='';
   adata.activities.forEach(a=>{
@@ -1111,6 +1445,17 @@ function renderCart(){
 def index():
     return render_template_string(HTML)
 
+# ───────────────── CLI ─────────────────
+@app.cli.command("import-osm")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--region", help="Store name (default: file name). Re-importing a region replaces it.")
+def cli_import_osm(path, region):
+    """Import an OSM extract (.osm XML or .osm.pbf) into the local POI store."""
+    region = region or os.path.basename(path).split(".")[0]
+    tags = list(dict.fromkeys(interest_osm_tags(list(INTEREST_TAGS)) + DEFAULT_OSM_TAGS))
+    meta = import_osm(path, region, tags, classify_osm)
+    click.echo(f"{meta['region']}: {meta['count']} POIs, bounds {meta['bounds']}")
+
 if __name__ == "__main__":
     import os
     port = int(os.getenv("PORT", 7860))
@@ -1,6 +1,9 @@
 import os, json, requests
 from typing import List, Dict, Optional
 
+from utils.geocode import cached_geocode
+from utils.http import http_get, http_post
+
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 OPENMETEO_GEOCODE = "https://geocoding-api.open-meteo.com/v1/search"
 OPENMETEO_FORECAST = "https://api.open-meteo.com/v1/forecast"
@@ -8,22 +11,15 @@ OPENTRIPMAP_API_KEY = os.getenv("OPENTRIPMAP_API_KEY")
 TICKETMASTER_API_KEY = os.getenv("TICKETMASTER_API_KEY")
 
 def _safe_get(url: str, params: dict=None, timeout: int=20) -> Optional[requests.Response]:
-    try:
-        r = requests.get(url, params=params, timeout=timeout)
-        r.raise_for_status()
-        return r
-    except Exception:
-        return None
+    return http_get(url, params=params, timeout=timeout)
 
 def _safe_post(url: str, data=None, timeout: int=30) -> Optional[requests.Response]:
-    try:
-        r = requests.post(url, data=data, timeout=timeout)
-        r.raise_for_status()
-        return r
-    except Exception:
-        return None
+    return http_post(url, data=data, timeout=timeout)
 
 def geocode_city(query: str) -> Optional[Dict]:
+    return cached_geocode(query, _geocode_open_meteo)
+
+def _geocode_open_meteo(query: str) -> Optional[Dict]:
     r = _safe_get(OPENMETEO_GEOCODE, {"name": query, "count": 1, "language": "en"}, 20)
     if not r:
         return None
@@ -0,0 +1,66 @@
+import os, json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.cache import DiskCache
+from utils.geocode import normalize_query, gazetteer_lookup
+
+AIRPORTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "airports.json")
+IATA_TTL = int(os.getenv("IATA_TTL_SECONDS", 180 * 24 * 3600))
+IATA_MISS_TTL = 24 * 3600   # the API found nothing: don't ask again for a day
+
+_DISK = DiskCache("iata")
+_BY_CODE: Optional[Dict[str, Dict]] = None
+_BY_CITY: Dict[str, List[str]] = {}
+
+def _load() -> Dict[str, Dict]:
+    global _BY_CODE
+    if _BY_CODE is None:
+        try:
+            with open(AIRPORTS_PATH, encoding="utf-8") as f:
+                airports = json.load(f).get("airports", [])
+        except (OSError, ValueError):
+            airports = []
+        by_city: Dict[str, List[str]] = {}
+        for a in airports:
+            for c in a.get("cities", []):
+                for key in (normalize_query(c), normalize_query(f"{c}, {a.get('country', '')}")):
+                    by_city.setdefault(key, []).append(a["iata"])
+        _BY_CITY.update(by_city)
+        _BY_CODE = {a["iata"]: a for a in airports}
+    return _BY_CODE
+
+def airport(code: str) -> Optional[Dict]:
+    return _load().get((code or "").strip().upper())
+
+def bundled_iata(text: str) -> List[str]:
+    """Airports for a city from the bundled table (gazetteer aliases resolve too)."""
+    _load()
+    key = normalize_query(text)
+    codes = _BY_CITY.get(key)
+    if codes is None:
+        geo = gazetteer_lookup(text)
+        codes = _BY_CITY.get(normalize_query(geo["name"])) if geo else None
+    return list(codes or [])
+
+def resolve_iata(text: str, fetch: Optional[Callable[[str], Optional[List[str]]]] = None) -> List[str]:
+    """City name or IATA code -> airport/city codes, best first.
+    Bundled table -> bare 3-letter code -> SQLite cache -> `fetch(text)` (written back)."""
+    key = normalize_query(text)
+    if not key: return []
+    codes = bundled_iata(text)
+    if codes: return codes
+    t = text.strip().upper()
+    if len(t) == 3 and t.isalpha(): return [t]
+    hit = _DISK.get(key)
+    if hit is not None: return hit
+    codes = fetch(text) if fetch else None
+    if codes is None: return []   # couldn't ask (no token, upstream down): don't cache
+    _DISK.set(key, codes, ttl=IATA_TTL if codes else IATA_MISS_TTL)
+    return codes
+
+def airport_coords(text: str) -> Optional[Tuple[float, float]]:
+    """Coordinates of the main bundled airport for a city or code; no network."""
+    for code in bundled_iata(text) + [text]:
+        a = airport(code)
+        if a: return a["lat"], a["lon"]
+    return None
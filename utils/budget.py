@@ -0,0 +1,131 @@
+import os, time
+from collections import Counter
+from itertools import accumulate, combinations_with_replacement, permutations
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+CAP_TIME_BUDGET = float(os.getenv("CAP_TIME_BUDGET", 0.1))
+
+Pattern = Tuple[str, ...]   # a day's categories in visiting order
+
+def _arrange(cats: Sequence[str]) -> Optional[Pattern]:
+    """An order of `cats` with no two equal neighbours, or None."""
+    for p in sorted(set(permutations(cats))):
+        if all(a != b for a, b in zip(p, p[1:])): return p
+    return None
+
+def day_patterns(categories: Sequence[str], slots: int, price: Dict[str, float], cap: float) -> List[Pattern]:
+    """Every category multiset a day can hold: at most `slots` places, alternating categories,
+    total price within `cap`. If nothing fits, the cheapest single places (a day is never empty
+    just because the cap is tight)."""
+    cats = sorted(set(categories))
+    out = []
+    for k in range(1, slots + 1):
+        for combo in combinations_with_replacement(cats, k):
+            if sum(price[c] for c in combo) > cap: continue
+            p = _arrange(combo)
+            if p: out.append(p)
+    if not out and cats:
+        cheapest = min(price[c] for c in cats)
+        out = [(c,) for c in cats if price[c] == cheapest]
+    return out
+
+class _Pool:
+    """Candidates of one pool by category, best first, with prefix sums of their scores."""
+
+    def __init__(self, items: Sequence[Tuple[Any, str, float]]):
+        self.items: Dict[str, List[Any]] = {}
+        scores: Dict[str, List[float]] = {}
+        for it, cat, s in sorted(items, key=lambda x: -x[2]):
+            self.items.setdefault(cat, []).append(it)
+            scores.setdefault(cat, []).append(s)
+        self.prefix = {c: [0.0] + list(accumulate(v)) for c, v in scores.items()}
+
+    def gain(self, need: Dict[str, int], used: Dict[str, int]) -> Optional[float]:
+        g = 0.0
+        for c, k in need.items():
+            pre = self.prefix.get(c)
+            u = used.get(c, 0)
+            if pre is None or u + k >= len(pre): return None
+            g += pre[u + k] - pre[u]
+        return g
+
+def select_under_cap(pools: Sequence[Sequence[Tuple[Any, str, float]]], slots: int, cap: float,
+                     price: Dict[str, float], time_budget: float = CAP_TIME_BUDGET,
+                     key: Callable[[Any], Hashable] = id) -> List[List[Any]]:
+    """Pick up to `slots` (item, category, score) candidates per day, categories alternating and
+    each day's price within `cap`, maximising the total score with no item used twice (items with
+    the same `key(item)` count as one; a shared pool is expected to be deduplicated already).
+
+    When every day draws on the same pool (the same list object) the whole trip is solved at once
+    by branch-and-bound over per-category usage; marginal scores only fall as a category is used
+    more, so (days left) x (best day now) bounds the rest. The search stops at `time_budget`
+    with the best plan so far (never worse than filling days greedily); its days are then handed
+    out best first, as the greedy fill would order them. Distinct pools (one area per day) are
+    filled day by day, each day exactly."""
+    days = len(pools)
+    if not days: return []
+    cats = {cat for pool in pools for _, cat, _ in pool}
+    patterns = day_patterns(cats, slots, price, cap) + [()]
+    needs = [Counter(p) for p in patterns]
+
+    if all(pool is pools[0] for pool in pools):
+        pool = _Pool(pools[0])
+        left = _search(pool, needs, days, time_budget)
+        used: Dict[str, int] = {}
+        out = []
+        while left:
+            n = max(range(len(left)), key=lambda n: (pool.gain(needs[left[n]], used), -n))
+            day = []
+            for c in patterns[left.pop(n)]:
+                day.append(pool.items[c][used.get(c, 0)])
+                used[c] = used.get(c, 0) + 1
+            out.append(day)
+        return out
+
+    out, taken = [], set()
+    for items in pools:
+        pool = _Pool([x for x in items if key(x[0]) not in taken])
+        gains = [(g, i) for i, need in enumerate(needs) if (g := pool.gain(need, {})) is not None]
+        _, best = max(gains)
+        used = Counter()
+        day = []
+        for c in patterns[best]:
+            day.append(pool.items[c][used[c]]); used[c] += 1
+        taken.update(key(it) for it in day)
+        out.append(day)
+    return out
+
+def _search(pool: _Pool, needs: List[Counter], days: int, time_budget: float) -> List[int]:
+    """Pattern index per day (non-decreasing, as days are interchangeable)."""
+    deadline = time.monotonic() + time_budget
+    used: Dict[str, int] = {}
+
+    def apply(i, sign):
+        for c, k in needs[i].items(): used[c] = used.get(c, 0) + sign * k
+
+    # greedy start: each day takes the best pattern left
+    greedy, total = [], 0.0
+    for _ in range(days):
+        g, i = max((g, i) for i, need in enumerate(needs) if (g := pool.gain(need, used)) is not None)
+        greedy.append(i); total += g; apply(i, 1)
+    for i in greedy: apply(i, -1)
+    best = [total, sorted(greedy)]
+    chosen: List[int] = []
+
+    def dfs(d, total, start):
+        if d == days:
+            if total > best[0] + 1e-9: best[:] = [total, list(chosen)]
+            return
+        if time.monotonic() > deadline: return
+        gains = sorted(((g, i) for i in range(start, len(needs)) if (g := pool.gain(needs[i], used)) is not None), reverse=True)
+        if not gains: return
+        top = gains[0][0]
+        for g, i in gains:
+            # later days can't beat today's best pattern (scores only fall as categories fill up)
+            if total + g + (days - d - 1) * top <= best[0] + 1e-9: break
+            apply(i, 1); chosen.append(i)
+            dfs(d + 1, total + g, i)
+            chosen.pop(); apply(i, -1)
+
+    dfs(0, 0.0, 0)
+    return best[1]
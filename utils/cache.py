@@ -0,0 +1,114 @@
+import os, json, time, sqlite3, threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+CACHE_DIR = os.getenv("CACHE_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", 600))   # s between sweeps of expired rows
+
+class DiskCache:
+    """Tiny SQLite key/value store (JSON values, optional per-key TTL), shared by all workers.
+    Each process holds one connection behind a lock: under gevent a thread-local would be
+    per greenlet, i.e. a fresh connection (and WAL/schema setup) for every request."""
+
+    def __init__(self, name: str, path: Optional[str] = None):
+        self.path = path or os.path.join(CACHE_DIR, f"{name}.sqlite")
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._ok = True
+        self._purged = 0.0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        """The process's connection (call with the lock held); reopened after a fork."""
+        if not self._ok: return None
+        if self._db is None or self._pid != os.getpid():
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT NOT NULL, exp REAL)")
+            except sqlite3.Error:
+                # read-only or full disk: behave as an always-miss cache
+                self._ok = False
+                return None
+            self._db, self._pid = conn, os.getpid()
+        return self._db
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            conn = self._conn()
+            if conn is None: return None
+            try:
+                row = conn.execute("SELECT v, exp FROM kv WHERE k=?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if not row or (row[1] is not None and row[1] < time.time()): return None
+        return json.loads(row[0])
+
+    def expiry(self, key: str) -> Optional[float]:
+        """Expiry time of a live key without reading its value (0.0 if it never expires, None if
+        missing or expired). Every set() moves it, so it doubles as a cheap version stamp."""
+        with self._lock:
+            conn = self._conn()
+            if conn is None: return None
+            try:
+                row = conn.execute("SELECT exp FROM kv WHERE k=?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if not row or (row[0] is not None and row[0] < time.time()): return None
+        return row[0] or 0.0
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        exp = now + ttl if ttl else None
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            conn = self._conn()
+            if conn is None: return
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO kv (k, v, exp) VALUES (?, ?, ?)", (key, data, exp))
+                    # expired rows are only skipped on read; drop them now and then so the file stays bounded
+                    if now - self._purged > CACHE_PURGE_INTERVAL:
+                        self._purged = now
+                        conn.execute("DELETE FROM kv WHERE exp IS NOT NULL AND exp < ?", (now,))
+            except sqlite3.Error:
+                pass
+
+class TTLCache:
+    """Thread-safe in-memory LRU with per-entry expiry (process-local)."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None: return default
+            if hit[0] < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.pop(key, None)
+        return default if hit is None else hit[1]
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+_MISSING = object()
@@ -0,0 +1,100 @@
+import os, re, unicodedata
+from typing import Dict, List, Optional, Sequence, Set
+
+from utils.spatial import PoiIndex
+
+DEDUPE_RADIUS_M = float(os.getenv("DEDUPE_RADIUS_M", 150))
+NAME_THRESHOLD = 0.6
+GENERIC_NAMES = {"", "place", "unnamed place"}
+STOPWORDS = {"the", "of", "and", "de", "du", "des", "la", "le", "les", "el", "di", "del", "der", "die", "das", "st", "saint"}
+# words that say what a place is, not which one: 'Museum' alone doesn't identify 'Natural History Museum'
+GENERIC_TOKENS = {"museum", "musee", "museo", "gallery", "galerie", "cafe", "coffee", "bar", "pub", "restaurant",
+                  "pizzeria", "bistro", "brasserie", "bakery", "hotel", "hostel", "park", "parc", "parque", "garden",
+                  "jardin", "church", "eglise", "iglesia", "chiesa", "cathedral", "market", "marche", "mercado",
+                  "square", "plaza", "piazza", "station", "shop", "store", "tower", "bridge", "palace", "palais"}
+IDENTITY_TAGS = ("wikidata", "website")
+
+def norm_name(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", name)).strip()
+
+def _tokens(n: str) -> Set[str]:
+    return {t for t in n.split() if t not in STOPWORDS}
+
+def _trigrams(n: str) -> Set[str]:
+    n = f"  {n} "
+    return {n[i:i + 3] for i in range(len(n) - 2)}
+
+def _similarity(na: str, nb: str) -> float:
+    """Of two normalised names: max of token Jaccard, token containment ('Louvre' in 'Musée du
+    Louvre') and trigram Jaccard."""
+    if not na or not nb: return 0.0
+    if na == nb: return 1.0
+    ta, tb = _tokens(na), _tokens(nb)
+    best = 0.0
+    if ta and tb:
+        inter = len(ta & tb)
+        best = inter / len(ta | tb)
+        small = ta if len(ta) <= len(tb) else tb
+        if len("".join(small)) >= 4 and not (len(small) == 1 and small <= GENERIC_TOKENS):
+            best = max(best, inter / len(small))
+    # spelling only counts on the distinctive words ('Pizzeria Roma' vs 'Pizzeria Romeo' is 'roma' vs 'romeo')
+    da = " ".join(t for t in na.split() if t not in GENERIC_TOKENS and t not in STOPWORDS)
+    db = " ".join(t for t in nb.split() if t not in GENERIC_TOKENS and t not in STOPWORDS)
+    if not da or not db: return best
+    ga, gb = _trigrams(da), _trigrams(db)
+    return max(best, len(ga & gb) / len(ga | gb))
+
+def _wiki_title(p: Dict) -> str:
+    """OSM 'wikipedia' tag ('en:Louvre') or a Wikipedia record's title, normalised."""
+    tags = p.get("tags") if isinstance(p.get("tags"), dict) else {}
+    if tags.get("source") == "wikipedia": return norm_name(p.get("name"))
+    return norm_name(tags.get("wikipedia", "").split(":", 1)[-1])
+
+def same_place(a: Dict, b: Dict) -> Optional[bool]:
+    """True/False when the records say so (shared wikidata id, website or Wikipedia article,
+    conflicting wikidata ids); None when only names and categories can tell."""
+    ta = a.get("tags") if isinstance(a.get("tags"), dict) else {}
+    tb = b.get("tags") if isinstance(b.get("tags"), dict) else {}
+    for k in IDENTITY_TAGS:
+        if ta.get(k) and tb.get(k):
+            if ta[k] == tb[k]: return True
+            if k == "wikidata": return False
+    wa, wb = _wiki_title(a), _wiki_title(b)
+    if wa and wa == wb: return True
+    return None
+
+def richness(p: Dict) -> float:
+    tags = p.get("tags") if isinstance(p.get("tags"), dict) else {}
+    score = len(tags)
+    if norm_name(p.get("name")) not in GENERIC_NAMES: score += 2
+    if "wikidata" in tags or "wikipedia" in tags: score += 1
+    return score
+
+def merge_duplicates(pois: Sequence[Dict], radius_m: float = DEDUPE_RADIUS_M, threshold: float = NAME_THRESHOLD) -> List[Dict]:
+    """Collapse records of the same place (OSM node/way/relation, Wikipedia page, OpenTripMap
+    xid) that lie within `radius_m` and either share a wikidata id, website or Wikipedia article,
+    or have the same category and similar names; keep the richest one per cluster.
+    Neighbour lookups go through a grid index, so this stays close to linear. Output keeps
+    input order (position of each cluster's first member)."""
+    pois = list(pois)
+    parent = list(range(len(pois)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]; i = parent[i]
+        return i
+    names = [norm_name(p.get("name")) for p in pois]
+    index = PoiIndex(pois, cell_km=max(radius_m / 1000.0, 0.05))
+    for i, p in enumerate(pois):
+        if p.get("lat") is None or p.get("lon") is None or names[i] in GENERIC_NAMES: continue
+        for j in index.within(p["lat"], p["lon"], radius_m / 1000.0):
+            if j <= i or names[j] in GENERIC_NAMES or find(i) == find(j): continue
+            same = same_place(p, pois[j])
+            if same is None:
+                same = p.get("category") == pois[j].get("category") and _similarity(names[i], names[j]) >= threshold
+            if same: parent[find(j)] = find(i)
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(pois)):
+        clusters.setdefault(find(i), []).append(i)
+    keep = sorted((min(m), max(m, key=lambda k: (richness(pois[k]), -k))) for m in clusters.values())
+    return [pois[k] for _, k in keep]
@@ -0,0 +1,36 @@
+import os, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 16))
+
+# One bounded pool per process; upstream calls that overrun their deadline keep
+# running here (threads can't be cancelled) so they still warm the caches.
+_POOL = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+def submit(fn: Callable, *args, **kwargs):
+    return _POOL.submit(fn, *args, **kwargs)
+
+def fan_out_iter(tasks: Dict[str, Tuple[Callable[[], Any], float]]) -> Iterator[Tuple[str, Any]]:
+    """Run {name: (fn, deadline_s)} concurrently and yield (name, result) as each task
+    finishes without raising, dropping any task once its own deadline (from the start) passes."""
+    t0 = time.monotonic()
+    pending = {_POOL.submit(fn): (name, deadline) for name, (fn, deadline) in tasks.items()}
+    while pending:
+        now = time.monotonic() - t0
+        for fut in [f for f, (_, deadline) in pending.items() if deadline <= now and not f.done()]:
+            del pending[fut]
+        if not pending: break
+        timeout = min(deadline for _, deadline in pending.values()) - now
+        done, _ = wait(list(pending), timeout=max(timeout, 0.0), return_when=FIRST_COMPLETED)
+        for fut in done:
+            name, _ = pending.pop(fut)
+            try:
+                yield name, fut.result()
+            except Exception:
+                # the source itself failed
+                continue
+
+def fan_out(tasks: Dict[str, Tuple[Callable[[], Any], float]]) -> Dict[str, Any]:
+    """Like fan_out_iter, but wait for everything and return {name: result}."""
+    return dict(fan_out_iter(tasks))
@@ -0,0 +1,43 @@
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+# Bit layout of a POI's feature mask: one bit per category, then tag flags.
+CATEGORIES = ["culture", "nature", "adventure", "food", "nightlife", "shopping", "family", "architecture", "photography", "general"]
+TAG_FLAGS = ["museum", "park"]
+FEATURES = CATEGORIES + [f"tag:{t}" for t in TAG_FLAGS]
+_BIT = {f: 1 << i for i, f in enumerate(FEATURES)}
+_SHIFTS = np.arange(len(FEATURES), dtype=np.uint32)
+
+# interest -> (feature, weight) bonuses on top of the 1.5 for a matching category
+TAG_BONUS = {"culture": ("tag:museum", 0.3), "nature": ("tag:park", 0.3)}
+
+def feature_bits(category: Optional[str], tags: Optional[Dict] = None) -> int:
+    """Pack category and tag flags into an int; computed once when a POI is ingested."""
+    bits = _BIT.get(category or "general", _BIT["general"])
+    if tags:
+        text = " ".join(f"{k} {v}" for k, v in tags.items()).lower()
+        for t in TAG_FLAGS:
+            if t in text: bits |= _BIT[f"tag:{t}"]
+    return bits
+
+def poi_bits(p: Dict) -> int:
+    bits = p.get("fbits")
+    return bits if bits is not None else feature_bits(p.get("category"), p.get("tags") if isinstance(p.get("tags"), dict) else None)
+
+def feature_matrix(pois: Sequence[Dict]) -> np.ndarray:
+    bits = np.fromiter((poi_bits(p) for p in pois), dtype=np.uint32, count=len(pois))
+    return ((bits[:, None] >> _SHIFTS) & 1).astype(np.float32)
+
+def interest_vector(interests: List[str]) -> np.ndarray:
+    w = np.zeros(len(FEATURES), dtype=np.float32)
+    for i in interests or []:
+        if i in _BIT: w[FEATURES.index(i)] = 1.5
+        if i in TAG_BONUS:
+            f, bonus = TAG_BONUS[i]
+            w[FEATURES.index(f)] = bonus
+    return w
+
+def score_pois(pois: Sequence[Dict], interests: List[str], weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """1.0 + features . interest weights, for every POI at once."""
+    if not pois: return np.zeros(0, dtype=np.float32)
+    return 1.0 + feature_matrix(pois) @ (weights if weights is not None else interest_vector(interests))
@@ -0,0 +1,51 @@
+import os, time, threading
+from typing import Dict, Optional
+
+from utils.adapters import get_fx_rates
+
+FX_TTL = int(os.getenv("FX_TTL_SECONDS", 6 * 3600))
+FX_RETRY = int(os.getenv("FX_RETRY_SECONDS", 300))
+
+FX_COLD_WAIT = float(os.getenv("FX_COLD_WAIT_SECONDS", 5))
+
+# Process-wide USD-based table, refreshed by a background thread so a slow or
+# down rates API never holds up a request. A failed refresh keeps serving the
+# last good table (stale beats 1.0 for everyone) and backs off for FX_RETRY seconds.
+_STATE = {"rates": {"USD": 1.0}, "fetched": 0.0, "retry_at": 0.0, "running": False}
+_LOCK = threading.Lock()
+_FIRST = threading.Event()   # set once the first load has finished, good or not
+
+def _fresh(now: float, ttl: int) -> bool:
+    return now - _STATE["fetched"] < ttl or now < _STATE["retry_at"]
+
+def _refresh() -> None:
+    rates = {}
+    try:
+        for code, v in (get_fx_rates("USD") or {}).items():
+            try: rates[code.upper()] = float(v)
+            except (TypeError, ValueError): continue
+    except Exception:
+        rates = {}
+    with _LOCK:
+        now = time.time()
+        if rates:
+            rates["USD"] = 1.0
+            _STATE["rates"] = rates; _STATE["fetched"] = now
+        else:
+            _STATE["retry_at"] = now + FX_RETRY
+        _STATE["running"] = False
+    _FIRST.set()
+
+def fx_table(ttl: int = FX_TTL) -> Dict[str, float]:
+    """USD -> code rates, reloaded in the background once per TTL. Never raises; only a caller
+    arriving before the first load has finished waits for it, and at most FX_COLD_WAIT seconds."""
+    if not _fresh(time.time(), ttl):
+        with _LOCK:
+            start = not _fresh(time.time(), ttl) and not _STATE["running"]
+            if start: _STATE["running"] = True
+        if start: threading.Thread(target=_refresh, name="fx-refresh", daemon=True).start()
+    if not _FIRST.is_set(): _FIRST.wait(FX_COLD_WAIT)
+    return _STATE["rates"]
+
+def usd_to(code: str, table: Optional[Dict[str, float]] = None) -> float:
+    return (table if table is not None else fx_table()).get((code or "USD").upper(), 1.0)
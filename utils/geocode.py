@@ -0,0 +1,67 @@
+import os, re, json, unicodedata
+from typing import Callable, Dict, Optional
+
+from utils.cache import DiskCache
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "cities.json")
+GEOCODE_TTL = int(os.getenv("GEOCODE_TTL_SECONDS", 90 * 24 * 3600))
+MEMO_MAX = 5000
+
+_DISK = DiskCache("geocode")
+_MEMO: Dict[str, Dict] = {}
+_GAZ: Optional[Dict[str, Dict]] = None
+
+def _strip_accents(q: str) -> str:
+    # drop accents on Latin letters only; marks are part of the letter in other scripts (й, ガ)
+    out = []
+    for ch in unicodedata.normalize("NFKD", q):
+        if unicodedata.combining(ch) and out and out[-1] < "\u0250": continue
+        out.append(ch)
+    return unicodedata.normalize("NFC", "".join(out))
+
+def normalize_query(q: str) -> str:
+    """'  São Paulo, BR ' -> 'sao paulo, br' (accents, case, punctuation, spacing); other scripts
+    are kept as-is ('Москва' stays 'москва')."""
+    q = re.sub(r"[^\w\s,]", " ", _strip_accents(q or "").casefold())
+    q = re.sub(r"\s*,\s*", ", ", q)
+    return re.sub(r"\s+", " ", q).strip(" ,")
+
+def _gazetteer() -> Dict[str, Dict]:
+    global _GAZ
+    if _GAZ is None:
+        gaz = {}
+        try:
+            with open(GAZETTEER_PATH, encoding="utf-8") as f:
+                cities = json.load(f).get("cities", [])
+        except (OSError, ValueError):
+            cities = []
+        for c in cities:
+            geo = {"name": c["name"], "lat": c["lat"], "lon": c["lon"],
+                   "country": c.get("country"), "timezone": c.get("timezone") or "UTC"}
+            for n in [c["name"]] + c.get("aliases", []):
+                key = normalize_query(n)
+                gaz.setdefault(key, geo)
+                gaz.setdefault(f"{key}, {normalize_query(c.get('country',''))}", geo)
+        _GAZ = gaz
+    return _GAZ
+
+def gazetteer_lookup(query: str) -> Optional[Dict]:
+    hit = _gazetteer().get(normalize_query(query))
+    return dict(hit) if hit else None
+
+def cached_geocode(query: str, fetch: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+    """Gazetteer -> in-process memo -> SQLite cache -> `fetch(query)` (result written back)."""
+    key = normalize_query(query)
+    if not key:
+        # nothing cacheable left (punctuation only): let the API decide
+        return fetch(query) if (query or "").strip() else None
+    hit = _gazetteer().get(key) or _MEMO.get(key)
+    if hit: return dict(hit)
+    hit = _DISK.get(key)
+    if hit is None:
+        hit = fetch(query)
+        if not hit: return None
+        _DISK.set(key, hit, ttl=GEOCODE_TTL)
+    if len(_MEMO) >= MEMO_MAX: _MEMO.clear()
+    _MEMO[key] = hit
+    return dict(hit)
@@ -0,0 +1,124 @@
+import os, time, random, logging, threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("upstream")
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.3))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 4.0))
+BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("HTTP_BREAKER_COOLDOWN", 30.0))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# One keep-alive session per process; urllib3 keeps a separate connection pool per host.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
+class HostState:
+    """Circuit breaker plus counters for one upstream host."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = 0          # consecutive
+        self.open_until = 0.0
+        self.probing = False       # half-open: one trial request in flight
+        self.counters = {"requests": 0, "ok": 0, "errors": 0, "retries": 0, "short_circuits": 0,
+                         "latency_ms_total": 0.0, "latency_ms_last": 0.0}
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.failures < BREAKER_THRESHOLD: return True
+            if time.monotonic() < self.open_until or self.probing:
+                self.counters["short_circuits"] += 1
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok: bool, latency: float) -> None:
+        with self.lock:
+            c = self.counters
+            c["requests"] += 1; c["ok" if ok else "errors"] += 1
+            c["latency_ms_last"] = round(latency * 1000, 1); c["latency_ms_total"] += latency * 1000
+            self.probing = False
+            if ok:
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.failures >= BREAKER_THRESHOLD:
+                    self.open_until = time.monotonic() + BREAKER_COOLDOWN
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            c = dict(self.counters)
+            c["latency_ms_avg"] = round(c["latency_ms_total"] / c["requests"], 1) if c["requests"] else None
+            c["latency_ms_total"] = round(c["latency_ms_total"], 1)
+            c["breaker"] = "closed" if self.failures < BREAKER_THRESHOLD else (
+                "open" if time.monotonic() < self.open_until else "half-open")
+            return c
+
+_HOSTS: Dict[str, HostState] = {}
+_HOSTS_LOCK = threading.Lock()
+
+def _host(url: str) -> HostState:
+    name = urlsplit(url).netloc
+    with _HOSTS_LOCK:
+        return _HOSTS.setdefault(name, HostState())
+
+def _backoff(attempt: int, resp: Optional[requests.Response]) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+def request(method: str, url: str, retries: int = 1, **kwargs) -> Optional[requests.Response]:
+    """Pooled request with jittered retries and a per-host breaker. Returns None on any failure."""
+    host = _host(url)
+    for attempt in range(retries + 1):
+        if not host.allow():
+            log.warning("%s %s short-circuited (breaker open)", method, urlsplit(url).netloc)
+            return None
+        t0 = time.monotonic(); resp = None
+        try:
+            resp = _SESSION.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            host.record(False, time.monotonic() - t0)
+            err = e
+        else:
+            if resp.status_code in RETRY_STATUS:
+                host.record(False, time.monotonic() - t0)
+                err = f"HTTP {resp.status_code}"
+                resp.close()   # hand a streamed connection back to the pool
+            else:
+                # other 4xx are the caller's problem, not the host's: don't trip the breaker
+                host.record(True, time.monotonic() - t0)
+                if resp.status_code >= 400:
+                    log.warning("%s %s -> HTTP %s", method, url, resp.status_code)
+                    resp.close()
+                    return None
+                return resp
+        if attempt < retries:
+            with host.lock: host.counters["retries"] += 1
+            time.sleep(_backoff(attempt, resp))
+    log.warning("%s %s failed after %d attempt(s): %s", method, url, retries + 1, err)
+    return None
+
+def http_get(url: str, params: Optional[dict] = None, timeout: float = 25, headers: Optional[dict] = None,
+             retries: int = 2) -> Optional[requests.Response]:
+    return request("GET", url, retries=retries, params=params, timeout=timeout, headers=headers)
+
+def http_post(url: str, data=None, timeout: float = 30, headers: Optional[dict] = None, json_body=None,
+              retries: int = 1, stream: bool = False) -> Optional[requests.Response]:
+    """stream=True leaves the body unread (iter_content); the caller must close the response."""
+    if json_body is not None:
+        return request("POST", url, retries=retries, json=json_body, timeout=timeout, headers=headers, stream=stream)
+    return request("POST", url, retries=retries, data=data, timeout=timeout, headers=headers, stream=stream)
+
+def http_stats() -> Dict[str, Dict]:
+    with _HOSTS_LOCK:
+        hosts = dict(_HOSTS)
+    return {name: st.snapshot() for name, st in sorted(hosts.items())}
@@ -0,0 +1,72 @@
+import codecs, json, re
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+_WS = " \t\r\n,"
+TAIL_MAX = 64 * 1024   # what may follow the array (Overpass: a 'remark'); more is not read
+
+def iter_json_array(chunks: Iterable[bytes], key: str, tail: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """Yield the items (objects/arrays) of the array under `key` in a streamed JSON document,
+    decoding one item at a time so memory stays at one item plus one chunk. Raises ValueError
+    if the stream ends mid-array. Once the array closes, the keys that follow it in the same
+    object (up to TAIL_MAX bytes) are decoded into `tail` if given; otherwise nothing after the
+    array is read."""
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    dec = codecs.getincrementaldecoder("utf-8")()
+    raw = json.JSONDecoder().raw_decode
+    it = iter(chunks)
+    buf, pos, done = "", 0, False
+
+    def more():
+        nonlocal buf, pos, done
+        try:
+            chunk = next(it)
+        except StopIteration:
+            done = True
+            chunk = b""
+        buf = buf[pos:] + dec.decode(chunk, final=done)
+        pos = 0
+
+    while True:
+        m = start.search(buf, pos)
+        if m:
+            pos = m.end()
+            break
+        if done: return
+        pos = max(0, len(buf) - len(key) - 16)   # the key may straddle two chunks
+        more()
+    while True:
+        while pos < len(buf) and buf[pos] in _WS: pos += 1
+        if pos >= len(buf):
+            if done: raise ValueError(f"stream ended inside {key!r}")
+            more(); continue
+        if buf[pos] == "]":
+            if tail is not None:
+                rest = buf[pos + 1:]
+                for chunk in it:
+                    if len(rest) >= TAIL_MAX: break
+                    rest += dec.decode(chunk)
+                _parse_tail(rest, tail)
+            return
+        try:
+            item, end = raw(buf, pos)
+        except json.JSONDecodeError:
+            if done: raise ValueError(f"malformed item in {key!r}")
+            more(); continue
+        yield item
+        pos = end
+
+_KEY = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:\s*')
+
+def _parse_tail(text: str, tail: Dict[str, Any]) -> None:
+    """Decode the `"k": v` pairs of `text` into `tail`, stopping at the closing brace or at
+    anything malformed (a cut-off tail keeps the pairs before the cut)."""
+    raw = json.JSONDecoder().raw_decode
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos] in _WS: pos += 1
+        m = _KEY.match(text, pos)
+        if not m: return
+        try:
+            tail[json.loads(f'"{m.group(1)}"')], pos = raw(text, m.end())
+        except json.JSONDecodeError:
+            return
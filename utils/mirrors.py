@@ -0,0 +1,97 @@
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", 8))
+EWMA_ALPHA = 0.3
+MIRROR_STALE = float(os.getenv("MIRROR_STALE_SECONDS", 300))   # stats older than this are re-earned
+
+# Separate from the fan-out pool: a raced call is itself usually running inside a fan-out task.
+_POOL = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+class MirrorStats:
+    """Rolling (EWMA) latency and error rate per mirror URL, plus the calls still in flight:
+    a call that hasn't returned counts as at least as slow as it has been running, so a hung
+    mirror drops in the ranking before its timeout."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._inflight: Dict[str, List[float]] = {}
+
+    def begin(self, url: str) -> float:
+        t0 = time.monotonic()
+        with self._lock: self._inflight.setdefault(url, []).append(t0)
+        return t0
+
+    def record(self, url: str, ok: bool, latency: float, started: Optional[float] = None) -> None:
+        with self._lock:
+            if started is not None and started in self._inflight.get(url, ()): self._inflight[url].remove(started)
+            st = self._stats.setdefault(url, {"latency": latency, "errors": 0.0, "calls": 0})
+            st["latency"] += EWMA_ALPHA * (latency - st["latency"])
+            st["errors"] += EWMA_ALPHA * ((0.0 if ok else 1.0) - st["errors"])
+            st["calls"] += 1
+            st["updated"] = time.monotonic()
+
+    def score(self, url: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            st = self._stats.get(url)
+            running = now - min(self._inflight[url]) if self._inflight.get(url) else 0.0
+        # unknown mirrors get tried early so they earn stats; so do ones not heard from in a while
+        # (a mirror ranked last is otherwise only ever a hedge, and could never win back its place)
+        if not st or now - st["updated"] > MIRROR_STALE: return running
+        return max(st["latency"], running) * (1.0 + 4.0 * st["errors"])
+
+    def ranked(self, urls: List[str]) -> List[str]:
+        # stable sort: ties keep the configured order (main mirror first)
+        return sorted(urls, key=self.score)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            return {u: {"latency": st["latency"], "errors": st["errors"], "calls": st["calls"],
+                        "age": round(now - st["updated"], 1), "in_flight": len(self._inflight.get(u, ()))}
+                    for u, st in self._stats.items()}
+
+STATS = MirrorStats()
+
+def _timed(url: str, call: Callable[[str], Any]) -> Any:
+    t0 = STATS.begin(url)
+    try:
+        res = call(url)
+    except Exception:
+        res = None
+    STATS.record(url, res is not None, time.monotonic() - t0, started=t0)
+    return res
+
+def failover(urls: List[str], call: Callable[[str], Any]) -> Tuple[Any, Optional[str]]:
+    """Try mirrors one at a time, healthiest first; `call` returns None on failure."""
+    for url in STATS.ranked(urls):
+        res = _timed(url, call)
+        if res is not None: return res, url
+    return None, None
+
+def race(urls: List[str], call: Callable[[str], Any], hedge_delay: float) -> Tuple[Any, Optional[str]]:
+    """Start the healthiest mirror, hedge to the next one every `hedge_delay` seconds (or at
+    once when a call fails) and return the first good result. Losers are abandoned; their
+    outcome still feeds the stats."""
+    order = STATS.ranked(urls)
+    pending: Dict[Any, str] = {}
+    nxt = 0
+    def launch():
+        nonlocal nxt
+        pending[_POOL.submit(_timed, order[nxt], call)] = order[nxt]
+        nxt += 1
+    if order: launch()
+    while pending:
+        done, _ = wait(list(pending), timeout=hedge_delay if nxt < len(order) else None, return_when=FIRST_COMPLETED)
+        if not done:
+            launch()
+            continue
+        for fut in done:
+            url = pending.pop(fut)
+            res = fut.result()
+            if res is not None: return res, url
+        if nxt < len(order): launch()
+    return None, None
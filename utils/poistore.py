@@ -0,0 +1,260 @@
+import os, json, mmap, shutil, time
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from utils.cache import CACHE_DIR
+from utils.features import CATEGORIES, feature_bits
+from utils.spatial import haversine_to
+from utils.tiles import TILE_DEG, Tile, tile_of, tiles_for_radius
+
+try:
+    import osmium   # optional: only needed to import .osm.pbf extracts
+except ImportError:
+    osmium = None
+
+POI_STORE_DIR = os.getenv("POI_STORE_DIR") or os.path.join(CACHE_DIR, "poi")
+POI_STORE_RESCAN = float(os.getenv("POI_STORE_RESCAN_SECONDS", 30))   # how often to look for new/replaced regions
+
+Tag = Tuple[str, Optional[str]]
+Element = Tuple[str, int, Dict[str, str], float, float]   # (type, id, tags, lat, lon)
+Box = Tuple[float, float, float, float]                  # (south, west, north, east)
+
+# Columns of a region directory; every .npy is opened memory-mapped.
+#   lat, lon (float64) · mask (uint64, bit i = vocab[i] matches) · cat (uint8 into CATEGORIES)
+#   fbits (uint32) · tile (int64, sorted: the spatial index) · offsets (uint64 into records.jsonl)
+_ARRAYS = ("lat", "lon", "mask", "cat", "fbits", "tile", "offsets")
+
+def _tile_key(t: Tile) -> int:
+    return (t[0] + 4096) * 8192 + (t[1] + 4096)
+
+def _tag_matches(tag: Tag, tags: Dict) -> bool:
+    k, v = tag
+    return k in tags if v is None else tags.get(k) == v
+
+def _merge(boxes) -> Optional[Box]:
+    boxes = list(boxes)
+    if not boxes: return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def _xml_scan(path: str) -> Iterator[ET.Element]:
+    """Top-level elements (bounds/node/way/relation) of an .osm XML file, each freed after use."""
+    root = None
+    for event, el in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if root is None: root = el
+            continue
+        if el.tag in ("bounds", "node", "way", "relation"):
+            yield el
+            root.clear()
+
+def _xml_tags(el: ET.Element) -> Dict[str, str]:
+    return {t.get("k"): t.get("v") for t in el.iter("tag")}
+
+def _xml_elements(path: str, keep: Callable[[Dict], bool], bounds: List[Box]) -> Iterator[Element]:
+    """Stream an .osm XML extract; way/relation positions are bbox centres (like Overpass `out center`).
+    Relations come after the ways they use and ways after their nodes, so the file is read three
+    times: members of kept relations, then nodes of kept (or member) ways, then positions. Only
+    those nodes and ways are held in memory, not every coordinate in the extract."""
+    rel_ways, need = set(), set()
+    for el in _xml_scan(path):
+        if el.tag == "relation" and keep(_xml_tags(el)):
+            for m in el.iter("member"):
+                if m.get("type") == "way": rel_ways.add(int(m.get("ref")))
+                elif m.get("type") == "node": need.add(int(m.get("ref")))
+    for el in _xml_scan(path):
+        if el.tag == "way" and (int(el.get("id")) in rel_ways or keep(_xml_tags(el))):
+            need.update(int(nd.get("ref")) for nd in el.iter("nd"))
+    nodes: Dict[int, Tuple[float, float]] = {}
+    ways: Dict[int, Box] = {}
+    for el in _xml_scan(path):
+        if el.tag == "bounds":
+            bounds.append(tuple(float(el.get(k)) for k in ("minlat", "minlon", "maxlat", "maxlon")))
+            continue
+        oid = int(el.get("id"))
+        tags = _xml_tags(el)
+        kept = bool(tags) and keep(tags)
+        if el.tag == "node":
+            lat, lon = float(el.get("lat")), float(el.get("lon"))
+            if oid in need: nodes[oid] = (lat, lon)
+            box = (lat, lon, lat, lon)
+        elif el.tag == "way":
+            if not kept and oid not in rel_ways: continue
+            box = _merge(nodes[r] * 2 for r in (int(nd.get("ref")) for nd in el.iter("nd")) if r in nodes)
+            if box and oid in rel_ways: ways[oid] = box
+        else:
+            if not kept: continue
+            members = ((m.get("type"), int(m.get("ref"))) for m in el.iter("member"))
+            box = _merge(nodes[r] * 2 if t == "node" else ways[r] for t, r in members
+                         if (t == "node" and r in nodes) or (t == "way" and r in ways))
+        if box and kept:
+            yield el.tag, oid, tags, (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+def _pbf_elements(path: str, keep: Callable[[Dict], bool], bounds: List[Box]) -> Iterator[Element]:
+    if osmium is None:
+        raise RuntimeError("importing .pbf extracts needs the optional 'osmium' package (pip install osmium)")
+    out: List[Element] = []
+
+    def add(typ, oid, tags, pts):
+        box = _merge((la, lo, la, lo) for la, lo in pts)
+        if box: out.append((typ, oid, tags, (box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            if n.tags and n.location.valid():
+                tags = dict(n.tags)
+                if keep(tags): add("node", n.id, tags, [(n.location.lat, n.location.lon)])
+
+        def way(self, w):
+            if w.tags:
+                tags = dict(w.tags)
+                if keep(tags): add("way", w.id, tags, [(nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()])
+
+        def area(self, a):
+            # multipolygon relations; ways come through way()
+            if a.from_way() or not a.tags: return
+            tags = dict(a.tags)
+            if keep(tags):
+                add("relation", a.orig_id(), tags, [(n.lat, n.lon) for ring in a.outer_rings() for n in ring if n.location.valid()])
+
+    box = osmium.io.Reader(path).header().box()
+    if box.valid():
+        bounds.append((box.bottom_left.lat, box.bottom_left.lon, box.top_right.lat, box.top_right.lon))
+    Handler().apply_file(path, locations=True)
+    yield from out
+
+def import_osm(path: str, region: str, tags: Sequence[Tag], classify: Callable[[Dict], str],
+               root: str = POI_STORE_DIR) -> Dict:
+    """Filter an OSM extract (.osm XML or .osm.pbf) down to named POIs matching any of `tags`
+    and write it as a memory-mappable region under `root/region` (replacing any previous one)."""
+    vocab = list(dict.fromkeys(tags))
+    if len(vocab) > 64: raise ValueError("at most 64 distinct tag filters fit the mask column")
+    keep = lambda t: bool(t.get("name")) and any(_tag_matches(tag, t) for tag in vocab)
+    bounds: List[Box] = []
+    read = _pbf_elements if path.endswith(".pbf") else _xml_elements
+    rows = []
+    for typ, oid, t, lat, lon in read(path, keep, bounds):
+        mask = sum(1 << i for i, tag in enumerate(vocab) if _tag_matches(tag, t))
+        cat = classify(t)
+        rows.append((_tile_key(tile_of(lat, lon)), lat, lon, mask, CATEGORIES.index(cat) if cat in CATEGORIES else CATEGORIES.index("general"),
+                     feature_bits(cat, t), json.dumps({"type": typ, "id": oid, "tags": t}, ensure_ascii=False)))
+    rows.sort(key=lambda r: r[0])
+
+    final = os.path.join(root, region)
+    tmp = f"{final}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    offsets = [0]
+    with open(os.path.join(tmp, "records.jsonl"), "wb") as f:
+        for r in rows:
+            b = r[6].encode("utf-8") + b"\n"
+            f.write(b); offsets.append(offsets[-1] + len(b))
+    cols = {"tile": (0, np.int64), "lat": (1, np.float64), "lon": (2, np.float64), "mask": (3, np.uint64),
+            "cat": (4, np.uint8), "fbits": (5, np.uint32)}
+    for name, (i, dtype) in cols.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.array([r[i] for r in rows], dtype=dtype))
+    np.save(os.path.join(tmp, "offsets.npy"), np.array(offsets, dtype=np.uint64))
+    lats = [r[1] for r in rows]; lons = [r[2] for r in rows]
+    extent = (min(lats), min(lons), max(lats), max(lons)) if rows else None
+    meta = {"region": region, "count": len(rows), "bounds": _merge(bounds) or extent,
+            "tags": [list(t) for t in vocab], "tile_deg": TILE_DEG, "source": os.path.basename(path),
+            "imported_at": int(time.time())}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    old = f"{final}.old-{os.getpid()}"
+    if os.path.isdir(final): os.rename(final, old)
+    os.rename(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return meta
+
+class PoiRegion:
+    """One imported extract, opened read-only and memory-mapped."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        # the tile column is only a spatial index for the tile size it was built with
+        if self.meta.get("tile_deg") != TILE_DEG:
+            raise ValueError(f"{path}: imported with tile size {self.meta.get('tile_deg')}, POI_TILE_DEG is {TILE_DEG}; re-import it")
+        self.vocab = [tuple(t) for t in self.meta["tags"]]
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self._f = open(os.path.join(path, "records.jsonl"), "rb")
+        self._records = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["count"] else b""
+
+    def covers(self, lat: float, lon: float, radius_m: float) -> bool:
+        b = self.meta.get("bounds")
+        if not b: return False
+        dlat = radius_m / 111320.0
+        dlon = dlat / max(np.cos(np.radians(lat)), 0.01)
+        return b[0] <= lat - dlat and lat + dlat <= b[2] and b[1] <= lon - dlon and lon + dlon <= b[3]
+
+    def element(self, i: int) -> Dict:
+        el = json.loads(self._records[int(self.offsets[i]):int(self.offsets[i + 1])])
+        el.update(lat=float(self.lat[i]), lon=float(self.lon[i]), category=CATEGORIES[int(self.cat[i])], fbits=int(self.fbits[i]))
+        return el
+
+    def query(self, lat: float, lon: float, radius_m: float, tags: Sequence[Tag], keep: Optional[int] = None) -> Optional[List[Dict]]:
+        """Elements matching any of `tags` within `radius_m`, nearest first; at most `keep` per
+        (tile, tag), as the Overpass tile cache does. None if a tag wasn't imported."""
+        bits = []
+        for tag in tags:
+            if tuple(tag) not in self.vocab: return None
+            bits.append(np.uint64(1 << self.vocab.index(tuple(tag))))
+        picked = []
+        for t in tiles_for_radius(lat, lon, radius_m):
+            k = _tile_key(t)
+            lo, hi = np.searchsorted(self.tile, k, "left"), np.searchsorted(self.tile, k, "right")
+            if lo == hi: continue
+            mask = self.mask[lo:hi]
+            for bit in bits:
+                hits = np.nonzero(mask & bit)[0]
+                picked.append(lo + (hits[:keep] if keep else hits))
+        if not picked: return []
+        idx = np.unique(np.concatenate(picked))
+        d = haversine_to(lat, lon, self.lat[idx], self.lon[idx])
+        near = d <= radius_m / 1000.0
+        idx, d = idx[near], d[near]
+        return [self.element(i) for i in idx[np.argsort(d, kind="stable")]]
+
+class PoiStore:
+    """All regions imported under `root`, loaded on first use and reloaded when a region is
+    added, removed or re-imported (seen by its meta.json mtime, checked every POI_STORE_RESCAN s)."""
+
+    def __init__(self, root: str = POI_STORE_DIR):
+        self.root = root
+        self._regions: Optional[List[PoiRegion]] = None
+        self._stamp: Optional[Tuple] = None
+        self._checked = 0.0
+
+    def _scan(self) -> Tuple:
+        """(name, meta.json mtime) of every complete region; import's .tmp-/.old- dirs are skipped."""
+        found = []
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                if ".tmp-" in name or ".old-" in name: continue
+                try: found.append((name, os.stat(os.path.join(self.root, name, "meta.json")).st_mtime_ns))
+                except OSError: continue
+        return tuple(found)
+
+    def regions(self) -> List[PoiRegion]:
+        now = time.monotonic()
+        if self._regions is not None and now - self._checked < POI_STORE_RESCAN: return self._regions
+        self._checked = now
+        stamp = self._scan()
+        if stamp != self._stamp:
+            regions = []
+            for name, _ in stamp:
+                try: regions.append(PoiRegion(os.path.join(self.root, name)))
+                except (OSError, ValueError, KeyError): continue
+            # replaced regions' mmaps stay valid for queries still using them; GC closes them
+            self._regions, self._stamp = regions, stamp
+        return self._regions
+
+    def query(self, lat: float, lon: float, radius_m: float, tags: Sequence[Tag], keep: Optional[int] = None) -> Optional[List[Dict]]:
+        """Answer from the first region that fully covers the disc, else None (go to Overpass)."""
+        for r in self.regions():
+            if r.covers(lat, lon, radius_m):
+                found = r.query(lat, lon, radius_m, tags, keep)
+                if found is not None: return found
+        return None
@@ -0,0 +1,70 @@
+import functools, threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key: the first caller runs `fn`, callers
+    arriving while it is in flight wait and get the same result (or exception).
+    Nothing is kept once the call returns — caching stays with the callers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None: raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock: self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+GROUPS: Dict[str, SingleFlight] = {}
+
+def _freeze(v):
+    if isinstance(v, dict): return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple, set)): return tuple(_freeze(x) for x in v)
+    return v
+
+def single_flight(key: Optional[Callable[..., Hashable]] = None):
+    """Decorator: identical concurrent calls share one execution. `key(*args, **kwargs)`
+    picks what counts as identical (default: all arguments, lists frozen to tuples)."""
+    def wrap(fn):
+        group = GROUPS.setdefault(fn.__name__, SingleFlight())
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (_freeze(args), _freeze(kwargs))
+            return group.do(k, fn, *args, **kwargs)
+        return inner
+    return wrap
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: g.stats() for name, g in GROUPS.items()}
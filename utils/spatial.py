@@ -0,0 +1,82 @@
+import math
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+from utils.travel import EARTH_KM
+
+_KM_PER_DEG = 111.32
+
+def haversine_to(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    la0, la = math.radians(lat), np.radians(lats)
+    h = np.sin((la - la0) / 2) ** 2 + math.cos(la0) * np.cos(la) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+class PoiIndex:
+    """Uniform grid hash over POI coordinates (local km projection, `cell_km` cells).
+
+    Queries return indices into `self.pois`, nearest first; POIs without coordinates
+    are kept in `pois` but never match."""
+
+    def __init__(self, pois: Sequence[Dict], cell_km: float = 1.0):
+        self.pois = list(pois)
+        self.cell_km = cell_km
+        self._ids = np.array([i for i, p in enumerate(self.pois) if p.get("lat") is not None and p.get("lon") is not None], dtype=int)
+        self.lat = np.array([self.pois[i]["lat"] for i in self._ids], dtype=float)
+        self.lon = np.array([self.pois[i]["lon"] for i in self._ids], dtype=float)
+        lat0 = float(self.lat.mean()) if len(self.lat) else 0.0
+        self._kx = _KM_PER_DEG * max(math.cos(math.radians(lat0)), 0.01)
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for j, (la, lo) in enumerate(zip(self.lat, self.lon)):
+            self._cells.setdefault(self._cell(la, lo), []).append(j)
+        xs = [c[0] for c in self._cells] or [0]; ys = [c[1] for c in self._cells] or [0]
+        self._extent = (min(xs), min(ys), max(xs), max(ys))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lon * self._kx / self.cell_km), math.floor(lat * _KM_PER_DEG / self.cell_km))
+
+    def _gather(self, cx0: int, cy0: int, cx1: int, cy1: int) -> np.ndarray:
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            hits = [js for (cx, cy), js in self._cells.items() if cx0 <= cx <= cx1 and cy0 <= cy <= cy1]
+        else:
+            hits = [self._cells[c] for c in ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)) if c in self._cells]
+        return np.array([j for js in hits for j in js], dtype=int)
+
+    def _ranked(self, js: np.ndarray, lat: float, lon: float, limit_km: float = math.inf) -> List[int]:
+        if not len(js): return []
+        d = haversine_to(lat, lon, self.lat[js], self.lon[js])
+        keep = d <= limit_km
+        js, d = js[keep], d[keep]
+        return [int(self._ids[j]) for j in js[np.argsort(d, kind="stable")]]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[int]:
+        """POIs within `radius_km` of (lat, lon)."""
+        cx0, cy0 = self._cell(lat - radius_km / _KM_PER_DEG, lon - radius_km / self._kx)
+        cx1, cy1 = self._cell(lat + radius_km / _KM_PER_DEG, lon + radius_km / self._kx)
+        return self._ranked(self._gather(cx0, cy0, cx1, cy1), lat, lon, radius_km)
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[int]:
+        """The k POIs closest to (lat, lon), growing the searched square ring by ring."""
+        if k <= 0 or not len(self): return []
+        cx, cy = self._cell(lat, lon)
+        x0, y0, x1, y1 = self._extent
+        r = max(x0 - cx, cx - x1, y0 - cy, cy - y1, 0)   # first ring that reaches any data
+        while True:
+            js = self._gather(cx - r, cy - r, cx + r, cy + r)
+            # anything outside the square is at least r cells away
+            if len(js) >= min(k, len(self)):
+                d = np.sort(haversine_to(lat, lon, self.lat[js], self.lon[js]))
+                if len(js) == len(self) or d[min(k, len(js)) - 1] <= r * self.cell_km:
+                    return self._ranked(js, lat, lon)[:k]
+            r += 1
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> List[int]:
+        """POIs inside a lat/lon box, nearest to its centre first."""
+        cx0, cy0 = self._cell(south, west); cx1, cy1 = self._cell(north, east)
+        js = self._gather(cx0, cy0, cx1, cy1)
+        if len(js):
+            inside = (self.lat[js] >= south) & (self.lat[js] <= north) & (self.lon[js] >= west) & (self.lon[js] <= east)
+            js = js[inside]
+        return self._ranked(js, (south + north) / 2, (west + east) / 2)
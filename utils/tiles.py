@@ -0,0 +1,64 @@
+import os, math
+from typing import Iterable, List, Tuple
+
+# ~5.5 km north-south; narrower east-west away from the equator.
+TILE_DEG = float(os.getenv("POI_TILE_DEG", 0.05))
+_KM_PER_DEG = 111.32
+
+Tile = Tuple[int, int]
+
+def tile_of(lat: float, lon: float) -> Tile:
+    return (math.floor(lat / TILE_DEG), math.floor(lon / TILE_DEG))
+
+def tile_bounds(t: Tile) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile, rounded for stable Overpass bbox strings."""
+    i, j = t
+    return (round(i * TILE_DEG, 6), round(j * TILE_DEG, 6), round((i + 1) * TILE_DEG, 6), round((j + 1) * TILE_DEG, 6))
+
+def tiles_rects(tiles: Iterable[Tile]) -> List[Tuple[float, float, float, float]]:
+    """Cover a tile set with few (south, west, north, east) boxes: contiguous runs per row,
+    merged with the rows above when the run is identical (a ring becomes ~4 boxes, not 1)."""
+    rows: dict = {}
+    for i, j in sorted(set(tiles)):
+        runs = rows.setdefault(i, [])
+        if runs and runs[-1][1] == j - 1: runs[-1][1] = j
+        else: runs.append([j, j])
+    rects, open_ = [], {}   # (j0, j1) -> first row
+    for i in sorted(rows) + [None]:
+        runs = {tuple(r) for r in rows.get(i, [])}
+        for run in list(open_):
+            if run not in runs or i != last + 1:
+                rects.append((open_.pop(run), run[0], last, run[1]))
+        for run in runs:
+            open_.setdefault(run, i)
+        last = i
+    return [(round(i0 * TILE_DEG, 6), round(j0 * TILE_DEG, 6), round((i1 + 1) * TILE_DEG, 6), round((j1 + 1) * TILE_DEG, 6))
+            for i0, j0, i1, j1 in sorted(rects)]
+
+def _gap_km(lat: float, lon: float, t: Tile) -> float:
+    """Equirectangular distance from a point to the nearest edge of a tile (0 inside)."""
+    s, w, n, e = tile_bounds(t)
+    dlat = max(s - lat, 0.0, lat - n)
+    dlon = max(w - lon, 0.0, lon - e)
+    return math.hypot(dlat * _KM_PER_DEG, dlon * _KM_PER_DEG * math.cos(math.radians(lat)))
+
+def _far_km(lat: float, lon: float, t: Tile) -> float:
+    """Equirectangular distance from a point to the farthest corner of a tile."""
+    s, w, n, e = tile_bounds(t)
+    dlat = max(abs(lat - s), abs(lat - n))
+    dlon = max(abs(lon - w), abs(lon - e))
+    return math.hypot(dlat * _KM_PER_DEG, dlon * _KM_PER_DEG * math.cos(math.radians(lat)))
+
+def tiles_for_radius(lat: float, lon: float, radius_m: float) -> List[Tile]:
+    """Tiles that intersect the disc of `radius_m` around (lat, lon)."""
+    r_km = radius_m / 1000.0
+    dlat = r_km / _KM_PER_DEG
+    dlon = r_km / (_KM_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+    i0, j0 = tile_of(lat - dlat, lon - dlon)
+    i1, j1 = tile_of(lat + dlat, lon + dlon)
+    return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if _gap_km(lat, lon, (i, j)) <= r_km]
+
+def tiles_for_ring(lat: float, lon: float, inner_m: float, outer_m: float) -> List[Tile]:
+    """Tiles that intersect the annulus inner_m < d <= outer_m (tiles wholly inside the inner disc are skipped)."""
+    r_km = inner_m / 1000.0
+    return [t for t in tiles_for_radius(lat, lon, outer_m) if _far_km(lat, lon, t) > r_km]
@@ -0,0 +1,64 @@
+import os, threading, time
+from typing import Callable, Dict, Optional
+
+TOKEN_REFRESH_AT = float(os.getenv("TOKEN_REFRESH_AT", 0.75))   # refresh once 75% of the lifetime is used
+TOKEN_RETRY_MIN = 5.0
+TOKEN_RETRY_MAX = 300.0
+TOKEN_EXPIRY_SLACK = 10.0   # never hand out a token this close to expiry
+
+class TokenManager:
+    """OAuth client-credentials token kept fresh by one background thread.
+
+    `fetch()` returns the token response ({"access_token", "expires_in"}) or None.
+    `get()` never touches the network: it returns the current token, or None while the
+    first fetch is still running or the provider is failing (callers fall back as they
+    would without credentials)."""
+
+    def __init__(self, fetch: Callable[[], Optional[Dict]], name: str = "token"):
+        self._fetch = fetch
+        self.name = name
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._token: Optional[str] = None
+        self._exp = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-refresh", daemon=True)
+        self._thread.start()
+
+    def get(self) -> Optional[str]:
+        self.start()
+        with self._lock:
+            if self._token and time.time() < self._exp - TOKEN_EXPIRY_SLACK:
+                return self._token
+        self._wake.set()   # expired or missing: ask the refresher to try now
+        return None
+
+    def _refresh(self) -> Optional[float]:
+        """Fetch a token; returns seconds until the next refresh, or None on failure."""
+        try:
+            tok = self._fetch()
+        except Exception:
+            tok = None
+        if not tok or not tok.get("access_token"): return None
+        ttl = float(tok.get("expires_in") or 0)
+        with self._lock:
+            self._token, self._exp = tok["access_token"], time.time() + ttl
+        return max(ttl * TOKEN_REFRESH_AT, TOKEN_RETRY_MIN)
+
+    def _run(self) -> None:
+        retry = TOKEN_RETRY_MIN
+        while True:
+            last = time.monotonic()
+            wait = self._refresh()
+            if wait is None:
+                wait, retry = retry, min(retry * 2, TOKEN_RETRY_MAX)
+            else:
+                retry = TOKEN_RETRY_MIN
+            self._wake.wait(wait)
+            self._wake.clear()
+            # an early wake-up from get() still respects the minimum spacing between attempts
+            time.sleep(max(0.0, TOKEN_RETRY_MIN - (time.monotonic() - last)))
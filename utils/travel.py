@@ -1,29 +1,118 @@
-from typing import List, Dict, Tuple
-import math
+from typing import List, Dict, Sequence, Tuple
+import os, time
+import numpy as np
+
+EARTH_KM = 6371.0
+ROUTE_TIME_BUDGET = float(os.getenv("ROUTE_TIME_BUDGET", 0.05))
+
+def distance_matrix(lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+    """Pairwise haversine distances (km), computed once for all points."""
+    la = np.radians(np.asarray(lats, dtype=float)); lo = np.radians(np.asarray(lons, dtype=float))
+    dlat = la[:, None] - la[None, :]; dlon = lo[:, None] - lo[None, :]
+    h = np.sin(dlat / 2) ** 2 + np.cos(la)[:, None] * np.cos(la)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+def _route_matrix(items: List[Dict], center: Tuple[float,float]) -> np.ndarray:
+    """Node 0 is the city centre, 1..n the items (missing coords fall back to the centre),
+    n+1 a free 'end' node at distance 0 from everything so the path stays open."""
+    lat0, lon0 = center
+    lats = [lat0] + [it.get("lat") if it.get("lat") is not None else lat0 for it in items]
+    lons = [lon0] + [it.get("lon") if it.get("lon") is not None else lon0 for it in items]
+    D = np.zeros((len(lats) + 1, len(lats) + 1))
+    D[:-1, :-1] = distance_matrix(lats, lons)
+    return D
+
+def _nearest_neighbor(D: np.ndarray) -> np.ndarray:
+    n = len(D) - 2
+    visited = np.zeros(n + 1, dtype=bool); visited[0] = True
+    path = [0]; cur = 0
+    for _ in range(n):
+        nxt = int(np.argmin(np.where(visited, np.inf, D[cur, :n + 1])))
+        path.append(nxt); visited[nxt] = True; cur = nxt
+    return np.array(path + [n + 1])
+
+def _two_opt(P: np.ndarray, D: np.ndarray, deadline: float) -> bool:
+    """One sweep of best-improvement 2-opt per position; vectorised over the second cut."""
+    m = len(P); moved = False
+    for i in range(1, m - 2):
+        a, b = P[i - 1], P[i]
+        js = np.arange(i + 1, m - 1)
+        c, d = P[js], P[js + 1]
+        delta = D[a, c] + D[b, d] - D[a, b] - D[c, d]
+        k = int(np.argmin(delta))
+        if delta[k] < -1e-9:
+            j = js[k]; P[i:j + 1] = P[i:j + 1][::-1].copy(); moved = True
+        if time.monotonic() > deadline: break
+    return moved
+
+def _or_opt(P: np.ndarray, D: np.ndarray, deadline: float) -> Tuple[np.ndarray, bool]:
+    """Relocate one segment of 1-3 stops (optionally reversed) to its cheapest other slot."""
+    m = len(P)
+    for k in (1, 2, 3):
+        for i in range(1, m - k):
+            s0, s1, p, q = P[i], P[i + k - 1], P[i - 1], P[i + k]
+            gain = D[p, s0] + D[s1, q] - D[p, q]
+            rest = np.concatenate([P[:i], P[i + k:]])
+            u, v = rest[:-1], rest[1:]
+            fwd = D[u, s0] + D[s1, v] - D[u, v]
+            rev = D[u, s1] + D[s0, v] - D[u, v]
+            fwd[i - 1] = rev[i - 1] = np.inf   # the slot it came from
+            e_f, e_r = int(np.argmin(fwd)), int(np.argmin(rev))
+            best, e, seg = (fwd[e_f], e_f, P[i:i + k]) if fwd[e_f] <= rev[e_r] else (rev[e_r], e_r, P[i:i + k][::-1])
+            if best < gain - 1e-9:
+                return np.concatenate([rest[:e + 1], seg, rest[e + 1:]]), True
+            if time.monotonic() > deadline: return P, False
+    return P, False
 
 def order_nearest_neighbor(items: List[Dict], center: Tuple[float,float]) -> List[int]:
     """Heuristic: start near city center, then nearest-neighbor chaining. No external API calls."""
     if not items: return []
-    def hav(a,b,c,d):
-        R=6371; dlat=math.radians(c-a); dlon=math.radians(d-b)
-        h=math.sin(dlat/2)**2+math.cos(math.radians(a))*math.cos(math.radians(c))*math.sin(dlon/2)**2
-        return 2*R*math.asin(math.sqrt(h))
-    clats = [it.get("lat") for it in items]; clons = [it.get("lon") for it in items]
-    lat0, lon0 = center
-    # choose start as closest to center (skip None coords gracefully)
-    def dist_to_center(i):
-        la = clats[i] if clats[i] is not None else lat0
-        lo = clons[i] if clons[i] is not None else lon0
-        return hav(lat0, lon0, la, lo)
-    start_idx = min(range(len(items)), key=lambda i: dist_to_center(i))
-    unvisited = set(range(len(items))); order=[start_idx]; unvisited.remove(start_idx); cur=start_idx
-    while unvisited:
-        def d(i,j):
-            ai = clats[i] if clats[i] is not None else lat0
-            bi = clons[i] if clons[i] is not None else lon0
-            aj = clats[j] if clats[j] is not None else lat0
-            bj = clons[j] if clons[j] is not None else lon0
-            return hav(ai, bi, aj, bj)
-        nxt = min(unvisited, key=lambda j: d(cur, j))
-        order.append(nxt); unvisited.remove(nxt); cur = nxt
-    return order
+    return [int(i) - 1 for i in _nearest_neighbor(_route_matrix(items, center))[1:-1]]
+
+def optimize_route(items: List[Dict], center: Tuple[float,float], time_budget: float = ROUTE_TIME_BUDGET) -> List[int]:
+    """Open walking route from the city centre: nearest-neighbour start, then 2-opt and
+    Or-opt over a precomputed distance matrix until no move helps or the budget runs out."""
+    if not items: return []
+    if len(items) < 3: return order_nearest_neighbor(items, center)
+    deadline = time.monotonic() + time_budget
+    D = _route_matrix(items, center)
+    P = _nearest_neighbor(D)
+    while time.monotonic() < deadline:
+        moved = _two_opt(P, D, deadline)
+        P, relocated = _or_opt(P, D, deadline)
+        if not (moved or relocated): break
+    return [int(i) - 1 for i in P[1:-1]]
+
+def _balanced_assign(X: np.ndarray, C: np.ndarray, cap: int) -> np.ndarray:
+    """Nearest-centroid assignment where no cluster takes more than `cap` points."""
+    d = ((X[:, None, :] - C[None, :, :]) ** 2).sum(axis=2)
+    labels = np.full(len(X), -1); load = np.zeros(len(C), dtype=int); left = len(X)
+    for flat in np.argsort(d, axis=None):
+        i, c = divmod(int(flat), len(C))
+        if labels[i] < 0 and load[c] < cap:
+            labels[i] = c; load[c] += 1; left -= 1
+            if not left: break
+    return labels
+
+def cluster_by_area(items: List[Dict], k: int, iters: int = 25, seed: int = 0) -> List[List[int]]:
+    """Split items into k spatially compact, roughly equal groups (balanced k-means over
+    lat/lon scaled to local km). Each group keeps the input (ranking) order. Items
+    without coordinates are left out."""
+    idx = [i for i, it in enumerate(items) if it.get("lat") is not None and it.get("lon") is not None]
+    if not idx or k <= 0: return [[] for _ in range(max(k, 0))]
+    lat0 = float(np.mean([items[i]["lat"] for i in idx]))
+    X = np.array([[items[i]["lat"], items[i]["lon"] * np.cos(np.radians(lat0))] for i in idx], dtype=float)
+    n, kk = len(X), min(k, len(X))
+    rng = np.random.default_rng(seed)
+    C = [X[rng.integers(n)]]
+    for _ in range(1, kk):   # k-means++ seeding
+        d2 = ((X[:, None, :] - np.array(C)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        C.append(X[rng.choice(n, p=d2 / d2.sum())] if d2.sum() > 0 else X[rng.integers(n)])
+    C = np.array(C); cap = -(-n // kk)
+    for _ in range(iters):
+        labels = _balanced_assign(X, C, cap)
+        newC = np.array([X[labels == c].mean(axis=0) if (labels == c).any() else C[c] for c in range(kk)])
+        if np.allclose(newC, C): break
+        C = newC
+    groups = [[idx[j] for j in range(n) if labels[j] == c] for c in range(kk)]
+    return groups + [[] for _ in range(k - kk)]
@@ -0,0 +1,52 @@
+import copy, os, secrets
+from typing import Dict, Optional
+
+from utils.cache import DiskCache, TTLCache
+
+TRIP_TTL = int(os.getenv("TRIP_TTL_SECONDS", 7 * 24 * 3600))
+TRIP_CACHE_SIZE = int(os.getenv("TRIP_CACHE_SIZE", 2000))
+
+class TripStore:
+    """Planned trips keyed by an opaque id.
+
+    backend="memory": per-process LRU (fine for a single worker).
+    backend="sqlite": SQLite file shared by every worker on the host, with a per-process LRU
+    of decoded trips in front. A hit is checked against the row's expiry stamp (rewritten on
+    every put), so a replan served by another worker never leaves a stale copy here.
+
+    get() hands out a copy and put() keeps one: callers may edit a trip freely, and only what
+    they put() is ever seen by the next request."""
+
+    def __init__(self, backend: str = "memory"):
+        self.backend = backend
+        self._disk = DiskCache("trips") if backend == "sqlite" else None
+        self._mem = TTLCache(maxsize=TRIP_CACHE_SIZE, ttl=TRIP_TTL)
+
+    def create(self, trip: Dict) -> str:
+        trip_id = secrets.token_urlsafe(12)
+        self.put(trip_id, trip)
+        return trip_id
+
+    def get(self, trip_id: str) -> Optional[Dict]:
+        if not trip_id: return None
+        if self._disk is None: return copy.deepcopy(self._mem.get(trip_id))
+        key = f"trip:{trip_id}"
+        stamp = self._disk.expiry(key)
+        if stamp is None:
+            self._mem.pop(trip_id)
+            return None
+        hit = self._mem.get(trip_id)
+        if hit is not None and hit[0] == stamp: return copy.deepcopy(hit[1])
+        trip = self._disk.get(key)
+        if trip is not None: self._mem.set(trip_id, (stamp, copy.deepcopy(trip)))
+        return trip
+
+    def put(self, trip_id: str, trip: Dict) -> None:
+        trip = copy.deepcopy(trip)
+        if self._disk is None:
+            self._mem.set(trip_id, trip)
+            return
+        key = f"trip:{trip_id}"
+        self._disk.set(key, trip, ttl=TRIP_TTL)
+        stamp = self._disk.expiry(key)
+        if stamp is not None: self._mem.set(trip_id, (stamp, trip))
@@ -0,0 +1,97 @@
+import os, time, threading
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from utils.cache import TTLCache
+from utils.fanout import submit
+
+DAILY_VARS = ["weathercode", "temperature_2m_max", "temperature_2m_min", "precipitation_sum"]
+HOURLY_VARS = ["temperature_2m", "precipitation", "windspeed_10m"]
+WEATHER_CELL_DEG = float(os.getenv("WEATHER_CELL_DEG", 0.1))
+WEATHER_FRESH = float(os.getenv("WEATHER_FRESH_SECONDS", 3 * 3600))    # served as-is
+WEATHER_MAX_AGE = float(os.getenv("WEATHER_MAX_AGE_SECONDS", 48 * 3600)) # served stale while refreshing
+WEATHER_NO_DATA_TTL = 3600   # dates the API didn't return (e.g. past the forecast horizon)
+
+# (cell_lat, cell_lon, tz, date, hourly) -> (fetched_at, {"daily": {...}, "hourly": {...}} or None)
+_CACHE = TTLCache(maxsize=int(os.getenv("WEATHER_CACHE_SIZE", 20000)), ttl=WEATHER_MAX_AGE)
+_REFRESHING = set()
+_LOCK = threading.Lock()
+
+Fetch = Callable[[float, float, str, str, str, bool], Optional[Dict]]
+
+def weather_cell(lat: float, lon: float):
+    return (round(round(lat / WEATHER_CELL_DEG) * WEATHER_CELL_DEG, 4), round(round(lon / WEATHER_CELL_DEG) * WEATHER_CELL_DEG, 4))
+
+def _dates(start: str, end: str) -> List[str]:
+    d0, d1 = date.fromisoformat(start), date.fromisoformat(end)
+    return [(d0 + timedelta(days=i)).isoformat() for i in range((d1 - d0).days + 1)]
+
+def _split_days(data: Dict, dates: List[str], hourly: bool) -> Dict[str, Optional[Dict]]:
+    """Cut an Open-Meteo response into one record per requested date (None = no data)."""
+    out = {d: None for d in dates}
+    daily = data.get("daily") or {}
+    for i, d in enumerate(daily.get("time", [])):
+        if d not in out: continue
+        rec = {}
+        for v in DAILY_VARS:
+            vals = daily.get(v) or []
+            rec[v] = vals[i] if i < len(vals) else None
+        out[d] = {"daily": rec}
+        if hourly: out[d]["hourly"] = {"time": []} | {v: [] for v in HOURLY_VARS}
+    if hourly:
+        h = data.get("hourly") or {}
+        for i, t in enumerate(h.get("time", [])):
+            rec = out.get(t[:10])
+            if not rec: continue
+            rec["hourly"]["time"].append(t)
+            for v in HOURLY_VARS:
+                vals = h.get(v) or []
+                rec["hourly"][v].append(vals[i] if i < len(vals) else None)
+    return out
+
+def _fetch_into_cache(fetch: Fetch, cell, tz: str, dates: List[str], hourly: bool) -> bool:
+    data = fetch(cell[0], cell[1], dates[0], dates[-1], tz, hourly)
+    if not data: return False
+    now = time.time()
+    for d, rec in _split_days(data, dates, hourly).items():
+        _CACHE.set((cell, tz, d, hourly), (now, rec), ttl=None if rec else WEATHER_NO_DATA_TTL)
+    return True
+
+def _refresh(fetch: Fetch, cell, tz: str, dates: List[str], hourly: bool, key) -> None:
+    try:
+        _fetch_into_cache(fetch, cell, tz, dates, hourly)
+    finally:
+        with _LOCK: _REFRESHING.discard(key)
+
+def cached_forecast(lat: float, lon: float, start: str, end: str, tz: str, fetch: Fetch, hourly: bool = False) -> Dict:
+    """Stale-while-revalidate forecast: per-day records keyed by grid cell, timezone and date.
+    Missing days are fetched inline; days older than WEATHER_FRESH are served immediately and
+    refreshed in the background. Hourly series are only requested when `hourly` is set."""
+    try:
+        dates = _dates(start, end)
+    except (TypeError, ValueError):
+        return fetch(lat, lon, start, end, tz, hourly) or {}
+    cell = weather_cell(lat, lon)
+    now = time.time()
+    hits = {d: _CACHE.get((cell, tz, d, hourly)) for d in dates}
+    missing = [d for d, h in hits.items() if h is None]
+    stale = [d for d, h in hits.items() if h is not None and now - h[0] > WEATHER_FRESH]
+    if missing and _fetch_into_cache(fetch, cell, tz, _dates(missing[0], missing[-1]), hourly):
+        hits = {d: _CACHE.get((cell, tz, d, hourly)) for d in dates}
+    elif stale:
+        key = (cell, tz, stale[0], stale[-1], hourly)
+        with _LOCK:
+            start_refresh = key not in _REFRESHING
+            _REFRESHING.add(key)
+        if start_refresh:
+            submit(_refresh, fetch, cell, tz, _dates(stale[0], stale[-1]), hourly, key)
+    daily = {"time": []} | {v: [] for v in DAILY_VARS}
+    hourly_out = {"time": []} | {v: [] for v in HOURLY_VARS}
+    for d in dates:
+        rec = (hits.get(d) or (None, None))[1]
+        if not rec: continue
+        daily["time"].append(d)
+        for v in DAILY_VARS: daily[v].append(rec["daily"].get(v))
+        if hourly:
+            for k in hourly_out: hourly_out[k] += rec.get("hourly", {}).get(k, [])
+    return {"daily": daily, "hourly": hourly_out} if hourly else {"daily": daily}